@@ -0,0 +1,215 @@
+import os
+import re
+import glob
+import gzip
+import json
+import hashlib
+import logging
+from access_logs.parser import parse_log_lines, parse_log_files
+
+
+LOG_FILE = '/var/log/nginx/access.log'
+LOG_TABLE = 'nginx'
+LOG_SCHEMA = 'logs'
+INGEST_BATCH_SIZE = 5000  # lines per insert
+FINGERPRINT_BYTES = 1024  # a file is recognised by the hash of its first bytes
+ROTATED_SUFFIX = re.compile(r'\.(\d+)(\.gz)?$')
+
+
+def open_log(path):
+    """
+    open a log file for binary reading, decompressing .gz files
+    """
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def fingerprint(path, size=FINGERPRINT_BYTES):
+    """
+    identify a log file by its first bytes, which survive renaming and compression
+    :param path: file name
+    :param size: number of bytes hashed
+    :return: (str, number of bytes hashed), or (None, 0) for an empty file
+    """
+    with open_log(path) as f:
+        head = f.read(size)
+    return (hashlib.sha1(head).hexdigest(), len(head)) if head else (None, 0)
+
+
+def log_files(path):
+    """
+    the live log and its rotations (path.1, path.2.gz, ...), newest first
+    :param path: live log file name
+    :return: list of file names
+    """
+    rotated = []
+    for name in glob.glob(f'{glob.escape(path)}.*'):
+        match = ROTATED_SUFFIX.search(name[len(path):])
+        if match and name[len(path):] == match.group(0):
+            rotated.append((int(match.group(1)), name))
+    return ([path] if os.path.isfile(path) else []) + [name for _, name in sorted(rotated)]
+
+
+class LogFollower(object):
+    def __init__(self, path=LOG_FILE, checkpoint=None, job=None):
+        """
+        read the lines appended to a log since the last run
+        the position (inode, fingerprint and byte offset of the file being read)
+        is kept in a CheckpointStore. when the log has been rotated since, the file
+        holding the position is found among path.1, path.2.gz, ... by its
+        fingerprint and read to the end, followed by every newer file
+        :param path: live log file name
+        :param checkpoint: CheckpointStore
+        :param job: name of the position in the checkpoint store
+        """
+        self.path = path
+        self.checkpoint = checkpoint
+        self.job = job or f'access_log:{os.path.abspath(path)}'
+
+    def position(self):
+        """
+        :return: dict with inode, fingerprint and offset, or None on the first run
+        """
+        if self.checkpoint is None:
+            return None
+        position = self.checkpoint.get_cursor(self.job)
+        return json.loads(position) if position is not None else None
+
+    def commit(self, position):
+        """
+        save the position after the lines before it are stored
+        :param position: dict from batches()
+        :return: None
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.set_cursor(self.job, json.dumps(position))
+        return None
+
+    def _pending_files(self):
+        """
+        :return: list of (file name, offset to start from), oldest first
+        """
+        files = log_files(self.path)
+        if not files:
+            return []
+        position = self.position()
+        if position is None or position['fingerprint'] is None:
+            return [(files[0], 0)]
+        for idx, name in enumerate(files):
+            # the inode is lost when a rotated file is compressed or copied, so the file
+            # is recognised by its fingerprint, over as many bytes as were hashed then
+            if fingerprint(name, position['fingerprint_bytes'])[0] == position['fingerprint']:
+                if os.stat(name).st_ino != position['inode']:
+                    logging.info(f'{self.path}: resuming in {name}')
+                return [(name, position['offset'])] + [(newer, 0) for newer in files[:idx][::-1]]
+        logging.warning(f'{self.path}: last position not found in the rotated logs, '
+                        f'reading the live log from the start')
+        return [(files[0], 0)]
+
+    def _read(self, name, offset):
+        """
+        generator of (line, offset after the line) for the complete lines after offset
+        a trailing line without a newline is still being written and is left for later
+        """
+        with open_log(name) as f:
+            if not name.endswith('.gz'):
+                f.seek(0, os.SEEK_END)
+                if f.tell() < offset:  # truncated in place (copytruncate)
+                    offset = 0
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                yield line.decode('utf-8', 'replace'), offset
+
+    def batches(self, batch_size=INGEST_BATCH_SIZE):
+        """
+        generator of (lines, position) with at most batch_size lines each
+        commit(position) once the lines are stored
+        """
+        for name, offset in self._pending_files():
+            digest, n_bytes = fingerprint(name)
+            position = {
+                'file': name,
+                'inode': os.stat(name).st_ino,
+                'fingerprint': digest,
+                'fingerprint_bytes': n_bytes,
+                'offset': offset
+            }
+            lines = []
+            for line, offset in self._read(name, offset):
+                lines.append(line)
+                if len(lines) >= batch_size:
+                    yield lines, dict(position, offset=offset)
+                    lines = []
+            yield lines, dict(position, offset=offset)
+
+
+def ingest_log(db, path=LOG_FILE, checkpoint=None, batch_size=INGEST_BATCH_SIZE, on_batch=None):
+    """
+    store the lines appended to an nginx log since the last run in logs.nginx
+    delivery is at least once: a batch is stored and passed to on_batch before its
+    position is committed, so after a crash between the two the batch is read, stored
+    and passed to on_batch again on the next run. on_batch should tolerate that
+    (TrafficSketches.update counts such a batch twice in its count-min sketches)
+    :param db: DBPostgreSQL object
+    :param path: live log file name
+    :param checkpoint: CheckpointStore holding the read position; None reads everything
+    :param batch_size: lines per insert
+    :param on_batch: function called with each parsed data frame after it is stored
+    :return: int, number of lines read
+    """
+    follower = LogFollower(path, checkpoint)
+    n_lines = 0
+    for lines, position in follower.batches(batch_size):
+        if lines:
+            df = parse_log_lines(lines)
+            db.insert_rows(df, LOG_TABLE, schema=LOG_SCHEMA)
+            if on_batch is not None:
+                on_batch(df)
+            n_lines += len(lines)
+        follower.commit(position)
+    return n_lines
+
+
+def backfill_log(db, path=LOG_FILE, checkpoint=None, processes=None, batch_size=INGEST_BATCH_SIZE,
+                 on_batch=None):
+    """
+    first run over a log that already has rotations: the rotated files (path.1,
+    path.2.gz, ...) are parsed whole on a process pool, then the live log is read
+    as by ingest_log, from its start, and the position is kept for the next runs
+    :param db: DBPostgreSQL object
+    :param path: live log file name
+    :param checkpoint: CheckpointStore holding the read position, which must be empty
+    :param processes: size of the pool, see parse_log_files
+    :param batch_size: lines per insert
+    :param on_batch: function called with each parsed data frame after it is stored;
+        a crash before the position is committed replays the rotated files, see ingest_log
+    :return: int, number of lines read
+    """
+    follower = LogFollower(path, checkpoint)
+    if follower.position() is not None:
+        raise ValueError(f'{path} has been ingested before, backfilling would store lines twice')
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    rotated = log_files(path)[1:][::-1]  # oldest first
+    n_lines = 0
+    if rotated:
+        logging.info(f'{path}: parsing {len(rotated)} rotated files')
+        df = parse_log_files(rotated, processes)
+        for start in range(0, df.shape[0], batch_size):
+            chunk = df.iloc[start:start + batch_size]
+            db.insert_rows(chunk, LOG_TABLE, schema=LOG_SCHEMA)
+            if on_batch is not None:
+                on_batch(chunk)
+        n_lines = df.shape[0]
+    # the rotated files are done: continue from the start of the live log
+    digest, n_bytes = fingerprint(path)
+    follower.commit({
+        'file': path,
+        'inode': os.stat(path).st_ino,
+        'fingerprint': digest,
+        'fingerprint_bytes': n_bytes,
+        'offset': 0
+    })
+    return n_lines + ingest_log(db, path, checkpoint, batch_size, on_batch)
@@ -0,0 +1,164 @@
+import os
+import re
+import gzip
+import logging
+from functools import lru_cache
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from metrics import METRICS
+
+
+R0 = r"^([\d.]+) (\S+) (\S+) \[([\w:/]+\s[+-]\d{4})\] \"(.+?)\" (\d{3}) (\d+) \"([^\"]+)\" \"(.+?)\""
+LOG_PATTERN = re.compile(R0)
+LOG_COLUMNS = ('ip', 'timestamp', 'request', 'status', 'length', 'host', 'user_agent')
+# regex groups of LOG_PATTERN holding each column, in LOG_COLUMNS order
+LOG_GROUPS = (1, 4, 5, 6, 7, 8, 9)
+CHUNK_BYTES = 32 * 2 ** 20  # size of the byte ranges a log file is split into for the pool
+TIMESTAMP_CACHE_SIZE = 2 ** 14  # distinct seconds kept parsed; consecutive lines share them
+MONTHS = {month: i for i, month in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def parse_timestamp(stamp):
+    """
+    :param stamp: str, nginx time_local such as 10/Oct/2023:13:55:36 +0000
+    :return: datetime; the offset is dropped and the time read as UTC, as it always was
+    """
+    try:
+        # fixed positions in dd/Mon/yyyy:HH:MM:SS, several times faster than strptime
+        return datetime(
+            int(stamp[7:11]), MONTHS[stamp[3:6]], int(stamp[:2]),
+            int(stamp[12:14]), int(stamp[15:17]), int(stamp[18:20]), tzinfo=timezone.utc)
+    except (KeyError, ValueError):
+        ts = datetime.strptime(stamp.split(' ')[0], '%d/%b/%Y:%H:%M:%S')
+        return ts.replace(tzinfo=timezone.utc)
+
+
+def parse_columns(lines):
+    """
+    parse lines of an nginx access log (combined format) into columns
+    lines that do not match the format are skipped and counted
+    :param lines: iterable of str
+    :return: (dict of column name -> list, number of malformed lines)
+    """
+    match = LOG_PATTERN.match
+    ip, timestamp, request, status, length, host, user_agent = columns = tuple(
+        [] for _ in LOG_COLUMNS)
+    n_malformed = 0
+    for line in lines:
+        s = match(line)
+        if s is None:
+            n_malformed += 1
+            continue
+        g1, g4, g5, g6, g7, g8, g9 = s.group(*LOG_GROUPS)
+        try:
+            ts = parse_timestamp(g4)
+        except ValueError:
+            n_malformed += 1
+            continue
+        ip.append(g1)
+        timestamp.append(ts)
+        request.append(g5)
+        status.append(g6)
+        length.append(g7)
+        host.append(g8)
+        user_agent.append(g9)
+    return dict(zip(LOG_COLUMNS, columns)), n_malformed
+
+
+def columns_to_frame(columns, n_malformed=0):
+    """
+    :param columns: dict of column name -> list, from parse_columns
+    :param n_malformed: number of skipped lines, logged and counted in METRICS
+    :return: data frame with ip, timestamp, request, status, length, host, user_agent
+    """
+    if n_malformed:
+        logging.warning(f'skipped {n_malformed} malformed log lines')
+        METRICS.inc('log_lines_malformed_total', n_malformed)
+    return pd.DataFrame(columns, columns=list(LOG_COLUMNS))
+
+
+def parse_log_lines(lines):
+    """
+    parse lines of an nginx access log (combined format)
+    :param lines: iterable of str
+    :return: data frame with ip, timestamp, request, status, length, host, user_agent
+    """
+    return columns_to_frame(*parse_columns(lines))
+
+
+def _read_range(path, start, end):
+    """
+    generator of the lines of a file that start within [start, end)
+    the line running across start belongs to the previous range
+    """
+    with open(path, 'rb') as f:
+        position = start
+        if start > 0:
+            f.seek(start - 1)
+            position += len(f.readline()) - 1
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode('utf-8', 'replace')
+
+
+def _parse_part(part):
+    """
+    worker of parse_log_files
+    :param part: (file name, start, end); start and end are None for a whole .gz file
+    :return: (dict of column name -> list, number of malformed lines)
+    """
+    path, start, end = part
+    if start is None:
+        with gzip.open(path, 'rt', encoding='utf-8', errors='replace') as f:
+            return parse_columns(f)
+    return parse_columns(_read_range(path, start, end))
+
+
+def split_log_files(paths, chunk_bytes=CHUNK_BYTES):
+    """
+    split log files into parts that can be parsed independently
+    plain files are cut into byte ranges, gzip files cannot be and are one part each
+    :param paths: list of file names
+    :param chunk_bytes: size of a byte range
+    :return: list of (file name, start, end)
+    """
+    parts = []
+    for path in paths:
+        if path.endswith('.gz'):
+            parts.append((path, None, None))
+            continue
+        size = os.path.getsize(path)
+        parts.extend((path, start, min(start + chunk_bytes, size))
+                     for start in range(0, size, chunk_bytes))
+    return parts
+
+
+def parse_log_files(paths, processes=None, chunk_bytes=CHUNK_BYTES):
+    """
+    parse whole log files (rotated ones included) on a process pool
+    :param paths: list of file names, plain or .gz
+    :param processes: size of the pool, defaults to the number of cpus; 1 parses in this process
+    :param chunk_bytes: size of the byte ranges plain files are split into
+    :return: data frame with ip, timestamp, request, status, length, host, user_agent
+    """
+    parts = split_log_files(paths, chunk_bytes)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(parts) <= 1:
+        results = [_parse_part(part) for part in parts]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_parse_part, parts))
+    columns = {name: [] for name in LOG_COLUMNS}
+    n_malformed = 0
+    for part_columns, part_malformed in results:
+        for name in LOG_COLUMNS:
+            columns[name].extend(part_columns[name])
+        n_malformed += part_malformed
+    return columns_to_frame(columns, n_malformed)
@@ -0,0 +1,375 @@
+"""
+approximate traffic analytics over the nginx access log
+distinct client addresses are counted with HyperLogLog sketches per hour, day
+and month; the busiest user agents and request paths with count-min sketches
+per day and month. sketches are kept in a sqlite file, updated as lines are
+ingested and merged to answer reports, so reports never rescan logs.nginx.
+backfill from the rows already stored with
+    python -m access_logs.sketches --backfill
+"""
+
+import json
+import struct
+import argparse
+import numpy as np
+import pandas as pd
+from sqlite_store import SqliteStore
+
+
+SKETCH_FILE = 'cache/traffic_sketches.sqlite'
+# HyperLogLog precision per period: 2 ** p one-byte registers, standard error 1.04 / sqrt(2 ** p)
+HLL_PRECISION = {'hour': 12, 'day': 14, 'month': 14}
+CMS_WIDTH = 4096  # counters per row of a count-min sketch
+CMS_DEPTH = 4  # rows of a count-min sketch
+CMS_CANDIDATES = 200  # heaviest items remembered by a count-min sketch for top-k reports
+PERIOD_FORMATS = {'hour': '%Y-%m-%dT%H', 'day': '%Y-%m-%d', 'month': '%Y-%m'}
+TOP_PERIODS = ('day', 'month')  # periods the count-min sketches are kept for
+
+
+def hash_values(values):
+    """
+    :param values: iterable of str
+    :return: numpy array of uint64, stable across processes and runs
+    """
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def bit_length(x):
+    """
+    :param x: numpy array of uint64
+    :return: numpy array of int, number of bits needed for each value (0 for 0)
+    """
+    x = x.copy()
+    length = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= np.uint64(1 << shift)
+        length[big] += shift
+        x[big] >>= np.uint64(shift)
+    return length + (x > 0)
+
+
+class HyperLogLog(object):
+    def __init__(self, p=14, registers=None):
+        """
+        distinct count estimate in 2 ** p bytes
+        :param p: precision, 4 to 18
+        :param registers: numpy array of uint8, to restore a saved sketch
+        """
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8) if registers is None else registers
+
+    def add(self, values):
+        """
+        :param values: iterable of str
+        :return: None
+        """
+        hashes = hash_values(values)
+        if not len(hashes):
+            return None
+        q = 64 - self.p
+        idx = (hashes >> np.uint64(q)).astype(np.int64)
+        rest = hashes & np.uint64((1 << q) - 1)
+        # position of the leftmost 1 in the remaining q bits
+        rank = (q + 1 - bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+        return None
+
+    def merge(self, other):
+        """
+        fold another sketch of the same or a higher precision into this one
+        :return: self
+        """
+        registers = other.registers
+        if other.p > self.p:
+            registers = other.fold(self.p).registers
+        elif other.p < self.p:
+            raise ValueError(f'cannot merge a p={other.p} sketch into a p={self.p} sketch')
+        np.maximum(self.registers, registers, out=self.registers)
+        return self
+
+    def fold(self, p):
+        """
+        :param p: lower precision
+        :return: HyperLogLog, this sketch at precision p
+        """
+        shift = self.p - p
+        # the dropped index bits become the leading bits of the remaining hash
+        low = np.arange(self.m) & ((1 << shift) - 1)
+        lead = shift - bit_length(low.astype(np.uint64))
+        rank = np.where(self.registers == 0, 0, np.where(
+            low == 0, self.registers.astype(np.int64) + shift, lead + 1))
+        registers = np.zeros(1 << p, dtype=np.uint8)
+        np.maximum.at(registers, np.arange(self.m) >> shift, rank.astype(np.uint8))
+        return HyperLogLog(p, registers)
+
+    def count(self):
+        """
+        :return: int, estimated number of distinct values added
+        """
+        m = self.m
+        alpha = .7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1., -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return struct.pack('<B', self.p) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        p = data[0]
+        return cls(p, np.frombuffer(data[1:], dtype=np.uint8).copy())
+
+
+class CountMinSketch(object):
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH, table=None, candidates=None,
+                 max_candidates=CMS_CANDIDATES):
+        """
+        frequency estimates in width * depth counters, never below the true count
+        the heaviest items seen are remembered so the top ones can be listed
+        :param width: counters per row
+        :param depth: number of rows (independent hashes)
+        :param table: numpy array of uint32 (depth, width), to restore a saved sketch
+        :param candidates: dict, item -> estimate, to restore a saved sketch
+        :param max_candidates: number of heavy items remembered
+        """
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint32) if table is None else table
+        self.candidates = candidates or {}
+        self.max_candidates = max_candidates
+
+    def _columns(self, hashes):
+        # double hashing: row i uses h1 + i * h2
+        h1 = (hashes & np.uint64(0xffffffff)).astype(np.int64)
+        h2 = (hashes >> np.uint64(32)).astype(np.int64) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def _estimate(self, items):
+        columns = self._columns(hash_values(items))
+        return np.min([self.table[i, col] for i, col in enumerate(columns)], axis=0)
+
+    def _trim(self):
+        if len(self.candidates) > self.max_candidates:
+            heaviest = sorted(self.candidates.items(), key=lambda kv: -kv[1])
+            self.candidates = dict(heaviest[:self.max_candidates])
+        return None
+
+    def add(self, values):
+        """
+        :param values: iterable of str
+        :return: None
+        """
+        counts = pd.Series(values, dtype=object).value_counts()
+        if counts.empty:
+            return None
+        items = counts.index.tolist()
+        for i, col in enumerate(self._columns(hash_values(items))):
+            np.add.at(self.table[i], col, counts.values.astype(np.uint32))
+        items = list(set(items) | set(self.candidates))
+        self.candidates = dict(zip(items, self._estimate(items).tolist()))
+        self._trim()
+        return None
+
+    def merge(self, other):
+        """
+        add the counts of another sketch of the same shape
+        :return: self
+        """
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError('cannot merge count-min sketches of different shapes')
+        self.table += other.table
+        items = list(set(self.candidates) | set(other.candidates))
+        if items:
+            self.candidates = dict(zip(items, self._estimate(items).tolist()))
+            self._trim()
+        return self
+
+    def top(self, k=10):
+        """
+        :return: list of (item, estimated count), heaviest first
+        """
+        return sorted(self.candidates.items(), key=lambda kv: -kv[1])[:k]
+
+    def to_bytes(self):
+        candidates = json.dumps(self.candidates).encode('utf-8')
+        return struct.pack('<II', self.width, self.depth) + self.table.tobytes() + candidates
+
+    @classmethod
+    def from_bytes(cls, data):
+        width, depth = struct.unpack('<II', data[:8])
+        end = 8 + 4 * width * depth
+        table = np.frombuffer(data[8:end], dtype=np.uint32).reshape(depth, width).copy()
+        return cls(width, depth, table, json.loads(data[end:].decode('utf-8')))
+
+
+SKETCH_TYPES = {'hll': HyperLogLog, 'cms': CountMinSketch}
+
+
+def request_paths(requests):
+    """
+    :param requests: pandas Series of request lines, such as GET /path?query HTTP/1.1
+    :return: pandas Series of paths without the query string
+    """
+    return requests.str.split(' ', n=2).str[1].fillna('').str.split('?', n=1).str[0]
+
+
+class TrafficSketches(SqliteStore):
+    def __init__(self, path=SKETCH_FILE):
+        """
+        persistent sketches of the access log, keyed by metric and time bucket
+        metrics: ips (HyperLogLog), user_agents and paths (count-min)
+        :param path: sqlite file name
+        """
+        super().__init__(path, schema=(
+            'CREATE TABLE IF NOT EXISTS sketches ('
+            'metric TEXT NOT NULL, period TEXT NOT NULL, bucket TEXT NOT NULL, '
+            'kind TEXT NOT NULL, data BLOB NOT NULL, '
+            'PRIMARY KEY (metric, period, bucket))',
+        ))
+
+    @staticmethod
+    def _get(con, metric, period, bucket):
+        row = con.execute(
+            'SELECT kind, data FROM sketches WHERE metric = ? AND period = ? AND bucket = ?',
+            (metric, period, bucket)).fetchone()
+        return None if row is None else SKETCH_TYPES[row[0]].from_bytes(row[1])
+
+    @staticmethod
+    def _put(con, metric, period, bucket, sketch):
+        kind = 'hll' if isinstance(sketch, HyperLogLog) else 'cms'
+        con.execute(
+            'INSERT INTO sketches (metric, period, bucket, kind, data) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (metric, period, bucket) DO UPDATE SET data = excluded.data',
+            (metric, period, bucket, kind, sketch.to_bytes()))
+
+    def get(self, metric, period, bucket):
+        """
+        :return: HyperLogLog or CountMinSketch, or None if nothing was recorded
+        """
+        with self._lock:
+            return self._get(self._con, metric, period, bucket)
+
+    def put(self, metric, period, bucket, sketch):
+        with self.transaction() as con:
+            self._put(con, metric, period, bucket, sketch)
+        return None
+
+    def buckets(self, metric, period):
+        """
+        :return: list of str, the buckets recorded for a metric, oldest first
+        """
+        rows = self.fetchall(
+            'SELECT bucket FROM sketches WHERE metric = ? AND period = ? ORDER BY bucket',
+            (metric, period))
+        return [row[0] for row in rows]
+
+    def _update(self, con, metric, period, bucket, values, new):
+        sketch = self._get(con, metric, period, bucket)
+        if sketch is None:
+            sketch = new()
+        sketch.add(values)
+        self._put(con, metric, period, bucket, sketch)
+        return None
+
+    def update(self, df):
+        """
+        add parsed log lines to the sketches of the hours, days and months they fall in
+        every sketch is written in one transaction, so a batch is added whole or not at all.
+        adding the same lines twice inflates the count-min sketches (HyperLogLog
+        counts are unaffected): see ingest_log for when a batch can be seen again
+        :param df: data frame with ip, timestamp, request and user_agent (parse_log_lines)
+        :return: None
+        """
+        if df.empty:
+            return None
+        timestamps = pd.to_datetime(df.timestamp, utc=True)
+        paths = request_paths(df.request.astype(str))
+        with self.transaction() as con:
+            for period, fmt in PERIOD_FORMATS.items():
+                buckets = timestamps.dt.strftime(fmt)
+                for bucket, idx in buckets.groupby(buckets).groups.items():
+                    self._update(con, 'ips', period, bucket, df.ip.loc[idx].tolist(),
+                                 lambda: HyperLogLog(HLL_PRECISION[period]))
+                    if period in TOP_PERIODS:
+                        self._update(con, 'user_agents', period, bucket,
+                                     df.user_agent.loc[idx].tolist(), CountMinSketch)
+                        self._update(con, 'paths', period, bucket,
+                                     paths.loc[idx].tolist(), CountMinSketch)
+        return None
+
+    def distinct_ips(self, period, bucket):
+        """
+        :param period: hour, day or month
+        :param bucket: e.g. 2024-05-01T13, 2024-05-01 or 2024-05
+        :return: int, estimated number of distinct client addresses
+        """
+        sketch = self.get('ips', period, bucket)
+        return 0 if sketch is None else sketch.count()
+
+    def distinct_ips_between(self, period, first, last):
+        """
+        distinct client addresses over a range of buckets, by merging their sketches
+        :return: int
+        """
+        merged = HyperLogLog(HLL_PRECISION[period])
+        for bucket in self.buckets('ips', period):
+            if first <= bucket <= last:
+                merged.merge(self.get('ips', period, bucket))
+        return merged.count()
+
+    def top(self, metric, period, bucket, k=10):
+        """
+        :param metric: user_agents or paths
+        :param period: day or month
+        :return: list of (value, estimated count), busiest first
+        """
+        sketch = self.get(metric, period, bucket)
+        return [] if sketch is None else sketch.top(k)
+
+    def report(self, when=None, k=10):
+        """
+        :param when: pandas Timestamp, defaults to now
+        :param k: number of top user agents and paths
+        :return: dict, distinct ips this hour, day and month; top user agents and paths this month
+        """
+        if when is None:
+            when = pd.Timestamp.now(tz='UTC')
+        buckets = {period: when.strftime(fmt) for period, fmt in PERIOD_FORMATS.items()}
+        output = {f'unique_ips_{period}': self.distinct_ips(period, bucket)
+                  for period, bucket in buckets.items()}
+        output['top_user_agents'] = self.top('user_agents', 'month', buckets['month'], k)
+        output['top_paths'] = self.top('paths', 'month', buckets['month'], k)
+        return output
+
+
+def backfill(db, sketches, chunksize=100000):
+    """
+    build the sketches from every row of logs.nginx, once, before incremental updates
+    :param db: DBPostgreSQL object
+    :param sketches: TrafficSketches
+    :return: int, number of rows read
+    """
+    n_rows = 0
+    for df in db.read_rows('nginx', schema='logs', chunksize=chunksize,
+                           columns=['ip', 'timestamp', 'request', 'user_agent']):
+        sketches.update(df)
+        n_rows += df.shape[0]
+    return n_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backfill', help='build the sketches from logs.nginx (run once)',
+                        action='store_true', default=False)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    store = TrafficSketches()
+    if args.backfill:
+        from sql.schema import DB_KEYS_POSTGRES
+        from database.database_util_postgres import DBPostgreSQL
+        print({'rows': backfill(DBPostgreSQL(DB_KEYS_POSTGRES), store)})
+    print(json.dumps(store.report(k=args.top), indent=2))
@@ -14,20 +14,53 @@ import plotly.express as px
 from dashboard.layout2 import (
     MAIN_LAYOUT, make_release_card, 
     make_artist_card, make_graph_card)
-from database.database_util_postgres import DBPostgreSQL
-from sql.schema import DB_KEYS_POSTGRES
+from dashboard.artist_search import (
+    artist_option, search_artist_options, register_search_endpoint)
+from services import SERVICES
+from metrics import instrument_callback, register_metrics_endpoint
+from result_cache import memoize, release_tags, entity_tags
 
 
 server = Flask(__name__)
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], server=server)
 app.title = " Vinyl Collection Analyser"
 app.layout = MAIN_LAYOUT
-DB = DBPostgreSQL(DB_KEYS_POSTGRES)
+register_metrics_endpoint(server)
+register_search_endpoint(server)
+DB = SERVICES.lazy('db')
+
+
+@memoize('artist_release_cards', tags=lambda output, artist_id:
+         release_tags(output[0]) + entity_tags('artist', [artist_id]))
+def artist_release_cards(artist_id):
+    # the release cards of an artist, with the release ids they show for invalidation
+    artist_by_release = DB.read_rows(
+        'artist_by_release', columns=['release_id'], artist_id=[artist_id])
+    release_ids = artist_by_release.release_id.values.tolist()
+    releases = DB.read_rows('last_price', release_id=release_ids)
+    return release_ids, [make_release_card(rel) for idx, rel in releases.iterrows()]
+
+
+@callback(
+    Output('main_dropdown', 'options'),
+    Input('main_dropdown', 'search_value'),
+    State('main_dropdown', 'value'))
+@instrument_callback
+def search_artists(search_value, value):
+    # the page ships no artist list: offer the best matches for the typed text,
+    # keeping the selected artist so the dropdown does not clear it
+    if not search_value:
+        raise PreventUpdate
+    options = search_artist_options(search_value)
+    if value and value not in [option['value'] for option in options]:
+        options.append(artist_option(value['id'], value['name']))
+    return options
 
 
 @callback(
     Output('column_1', 'children'),
     Input('main_dropdown', 'value'))
+@instrument_callback
 def show_artist(v):
     if not v:
         raise PreventUpdate
@@ -42,14 +75,13 @@ def show_artist(v):
         'desired_entity': ALL,
         'widget_type': 'button'
         }, 'n_clicks'))
+@instrument_callback
 def add_release_cards(_):
     if all([item is None for item in _]):
         raise PreventUpdate
     caller = Box(callback_context.triggered_id)
-    artist_by_release = DB.read_rows('artist_by_release', artist_id=[caller.id])
-    release_ids = artist_by_release.release_id.values.tolist()
-    releases = DB.read_rows('last_price', release_id=release_ids)
-    return [make_release_card(rel) for idx, rel in releases.iterrows()]
+    release_ids, cards = artist_release_cards(caller.id)
+    return cards
 
 
 @callback(
@@ -60,6 +92,7 @@ def add_release_cards(_):
         'id': ALL,
         'graph_type': 'timeseries'
     }, 'n_clicks'))
+@instrument_callback
 def create_graphs(_):
     if all([item is None for item in _]):
         raise PreventUpdate
@@ -0,0 +1,99 @@
+"""
+benchmark the daily bucketing used by make_timeseries_plot
+compares the per-release resample loop it replaced with resample_daily
+run from the repository root:
+    python -m benchmarks.bench_resample --releases 2000 --days 120
+"""
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from dashboard.plotter_util import resample_daily
+
+
+AGGREGATIONS = {
+    'lowest_price': 'min',
+    'num_for_sale': 'max'
+}
+
+
+def make_price_frame(n_releases, n_days, samples_per_day=4, seed=0):
+    """
+    synthetic marketplace samples shaped like the prices view
+    each release is sampled on a random subset of days, leaving gaps to fill
+    :param n_releases: number of releases
+    :param n_days: length of the history in days
+    :param samples_per_day: average samples per release per sampled day
+    :param seed: random seed
+    :return: data frame with release_id, when, lowest_price, num_for_sale
+    """
+    rng = np.random.default_rng(seed)
+    n = n_releases * n_days * samples_per_day // 2
+    start = np.datetime64('2022-01-01T00:00:00')
+    seconds = rng.integers(0, n_days * 86400, n).astype('timedelta64[s]')
+    df = pd.DataFrame({
+        'release_id': rng.integers(0, n_releases, n),
+        'when': start + seconds,
+        'lowest_price': rng.gamma(2., 10., n).round(2),
+        'num_for_sale': rng.integers(0, 100, n)
+    })
+    return df.sort_values(['release_id', 'when']).reset_index(drop=True)
+
+
+def legacy_resample(df):
+    """
+    the loop make_timeseries_plot used before resample_daily
+    """
+    df_list = []
+    for r in df.release_id.drop_duplicates():
+        df_list.append(
+            df[df.release_id.eq(r)]
+            .set_index('when')
+            .resample('24H')
+            .agg(AGGREGATIONS)
+            .reset_index()
+            .assign(release_id=r)
+        )
+    return pd.concat(df_list, axis=0)
+
+
+def best_time(func, df, repeat):
+    times = []
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        output = func(df)
+        times.append(time.perf_counter() - t1)
+    return min(times), output
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--releases', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    df = make_price_frame(args.releases, args.days, seed=args.seed)
+    t_legacy, legacy = best_time(legacy_resample, df, args.repeat)
+    t_new, new = best_time(lambda x: resample_daily(x, AGGREGATIONS), df, args.repeat)
+
+    columns = ['release_id', 'when', 'lowest_price', 'num_for_sale']
+    pd.testing.assert_frame_equal(
+        legacy[columns].reset_index(drop=True),
+        new[columns].reset_index(drop=True),
+        check_dtype=False)
+
+    print({
+        'rows': df.shape[0],
+        'releases': args.releases,
+        'days': args.days,
+        'legacy_seconds': round(t_legacy, 4),
+        'resample_daily_seconds': round(t_new, 4),
+        'speedup': round(t_legacy / t_new, 1)
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+synthetic data for the benchmark suite
+the generators are vectorised and seeded, so a given scale always produces
+the same tables
+"""
+
+import numpy as np
+import pandas as pd
+from sql.schema import *
+
+
+COUNTRIES = np.array(['US', 'UK', 'Germany', 'France', 'Japan', 'Netherlands', 'Canada', None],
+                     dtype=object)
+FORMATS = np.array(['Vinyl', 'CD', 'Cassette'], dtype=object)
+REQUESTS = np.array([
+    'GET / HTTP/1.1', 'GET /_dash-layout HTTP/1.1', 'GET /_dash-dependencies HTTP/1.1',
+    'POST /_dash-update-component HTTP/1.1', 'GET /assets/style.css HTTP/1.1',
+    'GET /favicon.ico HTTP/1.1', 'GET /robots.txt HTTP/1.1'], dtype=object)
+USER_AGENTS = np.array([
+    'Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 Safari/605.1.15',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+    'curl/7.81.0'], dtype=object)
+
+
+def make_metadata(n_releases, n_artists, n_labels, seed=0):
+    """
+    release, artist and label tables with their link tables
+    :param n_releases: number of releases (ids 0 .. n_releases - 1)
+    :param n_artists: number of artists
+    :param n_labels: number of labels
+    :param seed: random seed
+    :return: dict, table name -> data frame
+    """
+    rng = np.random.default_rng(seed)
+    release_ids = np.arange(n_releases)
+    releases = pd.DataFrame({
+        'release_id': release_ids,
+        'title': [f'Album {i % (n_releases // 3 + 1)}' for i in release_ids],
+        'year': rng.integers(1960, 2024, n_releases),
+        'country': rng.choice(COUNTRIES, n_releases),
+        'master_id': release_ids // 3,
+        'format': rng.choice(FORMATS, n_releases, p=[.8, .15, .05]),
+        'catno': [f'CAT{i:06d}' for i in release_ids],
+        'image': None,
+    })
+    artists = pd.DataFrame({
+        'artist_id': np.arange(n_artists),
+        'name': [f'Artist {i}' for i in range(n_artists)],
+    })
+    labels = pd.DataFrame({
+        'label_id': np.arange(n_labels),
+        'name': [f'Label {i}' for i in range(n_labels)],
+    })
+    # a few popular artists and labels account for most releases
+    artist_release = pd.DataFrame({
+        'release_id': release_ids,
+        'artist_id': np.minimum(rng.zipf(1.3, n_releases) - 1, n_artists - 1),
+        'artist_rank': 0,
+    })
+    label_release = pd.DataFrame({
+        'release_id': release_ids,
+        'label_id': np.minimum(rng.zipf(1.3, n_releases) - 1, n_labels - 1),
+        'label_rank': 0,
+    })
+    return {
+        RELEASE_TABLE: releases,
+        ARTIST_TABLE: artists,
+        LABEL_TABLE: labels,
+        E_ARTIST_RELEASE: artist_release,
+        E_LABEL_RELEASE: label_release,
+    }
+
+
+def make_marketplace(n_releases, n_days, samples_per_day=1, seed=0, end=None,
+                     releases_per_chunk=1000):
+    """
+    marketplace history: every release sampled samples_per_day times a day for n_days
+    prices follow a random walk around a per-release base price
+    :param n_releases: number of releases
+    :param n_days: days of history, ending at end
+    :param samples_per_day: samples per release per day
+    :param seed: random seed
+    :param end: pandas Timestamp, defaults to now
+    :param releases_per_chunk: releases per yielded frame, to bound memory
+    :return: generator of data frames with the marketplace columns
+    """
+    rng = np.random.default_rng(seed)
+    if end is None:
+        end = pd.Timestamp.now(tz='UTC')
+    n_samples = n_days * samples_per_day
+    start = end - pd.Timedelta(days=n_days)
+    step = 86400 // samples_per_day  # seconds between samples
+    offsets = np.arange(n_samples) * step
+    base = np.exp(rng.normal(2.8, .8, n_releases))
+    supply = np.exp(rng.normal(2., 1.3, n_releases)).astype(int)
+    for first in range(0, n_releases, releases_per_chunk):
+        ids = np.arange(first, min(first + releases_per_chunk, n_releases))
+        walk = np.exp(np.cumsum(rng.normal(0, .02, (len(ids), n_samples)), axis=1))
+        jitter = rng.integers(0, step, (len(ids), n_samples))
+        num_for_sale = np.maximum(0, supply[ids][:, None] + rng.integers(-2, 3, walk.shape))
+        yield pd.DataFrame({
+            'release_id': np.repeat(ids, n_samples),
+            'lowest_price': (base[ids][:, None] * walk).round(2).ravel(),
+            'currency': 'USD',
+            'num_for_sale': num_for_sale.ravel(),
+            'when': start + pd.to_timedelta(np.tile(offsets, len(ids)) + jitter.ravel(), unit='s'),
+        })
+
+
+def make_nginx_log(n_lines, n_ips=500, seed=0, end=None):
+    """
+    lines of an nginx access log in the combined format
+    :param n_lines: number of lines
+    :param n_ips: number of distinct client addresses
+    :param seed: random seed
+    :param end: pandas Timestamp of the last line, defaults to now
+    :return: list of str
+    """
+    rng = np.random.default_rng(seed)
+    if end is None:
+        end = pd.Timestamp.now(tz='UTC')
+    ips = np.array([f'{a}.{b}.{c}.{d}' for a, b, c, d in rng.integers(1, 255, (n_ips, 4))])
+    when = end - pd.to_timedelta(np.sort(rng.integers(0, 7 * 86400, n_lines))[::-1], unit='s')
+    stamps = when.strftime('%d/%b/%Y:%H:%M:%S +0000')
+    client = rng.choice(ips, n_lines)
+    request = rng.choice(REQUESTS, n_lines)
+    status = rng.choice([200, 200, 200, 204, 304, 404], n_lines)
+    length = rng.integers(0, 50000, n_lines)
+    agent = rng.choice(USER_AGENTS, n_lines)
+    return [
+        f'{client[i]} - - [{stamps[i]}] "{request[i]}" {status[i]} {length[i]} '
+        f'"https://howlucky.example/" "{agent[i]}"\n'
+        for i in range(n_lines)]
+
+
+def make_click_state(n_buttons, seed=0):
+    """
+    inputs of ClickState: the card store entities and their button click counts
+    :param n_buttons: number of cards with buttons
+    :param seed: random seed
+    :return: (list of dict with field and value, list of clicks with None for unclicked)
+    """
+    rng = np.random.default_rng(seed)
+    fields = rng.choice(['artist_id', 'label_id', 'release_id', 'master_id'], n_buttons)
+    entities = [{'field': field, 'value': int(value)}
+                for field, value in zip(fields, rng.integers(0, 100000, n_buttons))]
+    clicks = [None if c == 0 else int(c) for c in rng.integers(0, 4, n_buttons)]
+    return entities, clicks
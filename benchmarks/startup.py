@@ -0,0 +1,99 @@
+"""
+startup time of the web app: a fresh interpreter importing howlucky, as a gunicorn
+worker (or a preloading master) does, measured over several runs
+run from the repository root:
+    python -m benchmarks.startup --repeat 10
+    python -m benchmarks.startup --compare benchmarks/results/<previous run>.json
+importing should create no services (database, discogs client): the run fails if it does
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from benchmarks.suite import RESULTS_DIR, git_revision, compare, measure, summarize
+
+
+IMPORT_SCRIPT = (
+    'import time, json\n'
+    't1 = time.perf_counter()\n'
+    'import howlucky\n'
+    't2 = time.perf_counter()\n'
+    'from services import SERVICES\n'
+    'print(json.dumps({"import_seconds": t2 - t1, "initialized": SERVICES.initialized()}))\n')
+SLOWEST_IMPORTS = 15
+
+
+def run_import():
+    """
+    import howlucky in a fresh interpreter
+    :return: dict with import_seconds and the services initialized
+    """
+    done = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT], capture_output=True, text=True, check=True)
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(n=SLOWEST_IMPORTS):
+    """
+    :return: list of (module, cumulative seconds) from python -X importtime
+    """
+    done = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import howlucky'],
+        capture_output=True, text=True, check=True)
+    modules = []
+    for line in done.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = [part.strip() for part in line[len('import time:'):].split('|')]
+        modules.append((module.strip(), int(cumulative) / 1e6))
+    return sorted(modules, key=lambda m: -m[1])[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='output json file (default: benchmarks/results/...)')
+    parser.add_argument('--compare', help='previous output json file to compare against')
+    args = parser.parse_args()
+
+    runs = []
+    # the untimed warm-up call of measure warms the file system cache and __pycache__
+    process = measure(lambda: runs.append(run_import()), args.repeat)
+    runs = runs[1:]
+    initialized = sorted({name for r in runs for name in r['initialized']})
+    run = {
+        'revision': git_revision(),
+        'started': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'results': {
+            'startup.import_howlucky': summarize([r['import_seconds'] for r in runs]),
+            'startup.process': process
+        },
+        'initialized_at_import': initialized,
+        'slowest_imports': slowest_imports()
+    }
+    for name, result in run['results'].items():
+        print(f'{name:45s} median {result["median"]:.4f}s  min {result["min"]:.4f}s')
+    for module, seconds in run['slowest_imports']:
+        print(f'    {module:41s} {seconds:.4f}s')
+
+    output = args.output
+    if output is None:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        output = f'{RESULTS_DIR}/{stamp}_{run["revision"] or "unknown"}_startup.json'
+    with open(output, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f'results written to {output}')
+    if args.compare:
+        compare(run['results'], args.compare)
+    if initialized:
+        sys.exit(f'services created at import: {", ".join(initialized)}')
+
+
+if __name__ == '__main__':
+    main()
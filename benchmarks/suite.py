@@ -0,0 +1,250 @@
+"""
+end-to-end benchmarks of the hot paths, written to a JSON file per run
+run from the repository root against the database in keys/database_postgres.yaml:
+    python -m benchmarks.suite --load --releases 10000 --days 730
+    python -m benchmarks.suite --compare benchmarks/results/<previous run>.json
+--load TRUNCATES the marketplace and metadata tables and fills them with
+synthetic data: only use it on a scratch database. Without --load the suite
+reads whatever data is there; writes are always rolled back.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import warnings
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+from sql.schema import *
+from database.database_util import get_price_data, update_daily_prices
+from dashboard.plotter import DB, aggregate_prices, make_timeseries_plot
+from dashboard.plotter_util import ClickState
+from access_logs.parser import parse_log_lines, parse_log_files
+from benchmarks.datasets import make_metadata, make_marketplace, make_nginx_log, make_click_state
+
+
+RESULTS_DIR = 'benchmarks/results'
+LOADED_TABLES = [
+    MARKETPLACE_TABLE, MARKETPLACE_DAILY_TABLE, RELEASE_TABLE, ARTIST_TABLE, LABEL_TABLE,
+    E_ARTIST_RELEASE, E_LABEL_RELEASE]
+
+
+class Rollback(Exception):
+    pass
+
+
+def rolled_back(db, func):
+    """
+    call func inside a transaction that is always rolled back
+    """
+    def func_():
+        try:
+            with db.transaction():
+                func()
+                raise Rollback
+        except Rollback:
+            pass
+    return func_
+
+
+def summarize(times):
+    """
+    :param times: list of seconds
+    :return: dict of timing statistics in seconds
+    """
+    return {
+        'min': round(min(times), 6),
+        'median': round(float(np.median(times)), 6),
+        'mean': round(float(np.mean(times)), 6),
+        'max': round(max(times), 6),
+        'repeat': len(times)
+    }
+
+
+def measure(func, repeat):
+    """
+    :param func: function of no arguments
+    :param repeat: number of timed calls (after one untimed warm-up call)
+    :return: dict of timing statistics in seconds
+    """
+    func()
+    times = []
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t1)
+    return summarize(times)
+
+
+def load_dataset(db, args):
+    """
+    replace the marketplace and metadata tables with synthetic data
+    :return: dict, load timings and row counts
+    """
+    db._query(f'TRUNCATE {", ".join(LOADED_TABLES)}')
+    t1 = time.perf_counter()
+    for tbl, df in make_metadata(args.releases, args.artists, args.labels, args.seed).items():
+        db.insert_rows(df, tbl)
+    n_rows = 0
+    for df in make_marketplace(args.releases, args.days, args.samples_per_day, args.seed):
+        db.insert_rows(df, MARKETPLACE_TABLE)
+        n_rows += df.shape[0]
+    t2 = time.perf_counter()
+    update_daily_prices(db)
+    t3 = time.perf_counter()
+    db._query('ANALYZE')
+    return {
+        'marketplace_rows': n_rows,
+        'insert_seconds': round(t2 - t1, 3),
+        'rollup_seconds': round(t3 - t2, 3)
+    }
+
+
+def dataset_size(db):
+    output = {}
+    for tbl in (MARKETPLACE_TABLE, MARKETPLACE_DAILY_TABLE, RELEASE_TABLE):
+        output[tbl] = db._query(f'SELECT count(*) FROM {tbl}')[0][0]
+    return output
+
+
+def make_benchmarks(db, args, log_dir):
+    """
+    :param log_dir: directory the generated access log files are written to
+    :return: dict, benchmark name -> function of no arguments
+    """
+    rng = np.random.default_rng(args.seed)
+    release_ids = [row for row, in db._query(
+        f'SELECT release_id FROM {RELEASE_TABLE} ORDER BY release_id LIMIT 100000')]
+    few = rng.choice(release_ids, min(len(release_ids), 20), replace=False).tolist()
+    top_artist = db._query(
+        f'SELECT artist_id FROM {E_ARTIST_RELEASE} GROUP BY artist_id '
+        f'ORDER BY count(*) DESC LIMIT 1')[0][0]
+    insert_small = next(make_marketplace(100, 10, seed=args.seed + 1))
+    insert_large = next(make_marketplace(
+        1000, 50, seed=args.seed + 1, releases_per_chunk=1000))
+    log_lines = make_nginx_log(args.log_lines, seed=args.seed)
+    entities, clicks = make_click_state(args.buttons, seed=args.seed)
+    log_files = []
+    for i in range(4):  # the live log and three rotations
+        log_files.append(f'{log_dir}/access.log' + (f'.{i}' if i else ''))
+        with open(log_files[-1], 'w') as f:
+            f.writelines(make_nginx_log(args.log_lines, seed=args.seed + i))
+
+    def ingest_logs():
+        db.insert_rows(parse_log_lines(log_lines), 'nginx', schema='logs')
+
+    return {
+        'insert_rows.values_1k': rolled_back(
+            db, lambda: db.insert_rows(insert_small, MARKETPLACE_TABLE, method='values')),
+        'insert_rows.copy_50k': rolled_back(
+            db, lambda: db.insert_rows(insert_large, MARKETPLACE_TABLE, method='copy')),
+        'read_rows.marketplace_20_releases': lambda: db.read_rows(
+            MARKETPLACE_TABLE, release_id=few),
+        'read_rows.releases_projected_chunked': lambda: [
+            chunk for chunk in db.read_rows(
+                RELEASE_TABLE, chunksize=10000, columns=['release_id', 'title'])],
+        'get_price_data.top_artist': lambda: get_price_data(db, artist_id=[top_artist]),
+        'aggregate_prices.artist': lambda: aggregate_prices(
+            ['artist', 'artist_id'], 'median', 'median', None),
+        'aggregate_prices.album': lambda: aggregate_prices(
+            ['artist', 'title', 'release_id', 'artist_id', 'master_id'], 'median', 'median', None),
+        # __wrapped__ bypasses the result cache, which the .cached benchmark measures
+        'make_timeseries_plot.20_releases': lambda: make_timeseries_plot.__wrapped__(
+            color_var='artist', release_id=few),
+        'make_timeseries_plot.top_artist': lambda: make_timeseries_plot.__wrapped__(
+            color_var='artist', artist_id=[top_artist]),
+        'make_timeseries_plot.cached': lambda: make_timeseries_plot(
+            color_var='artist', release_id=few),
+        'ClickState.get_buttons_clicked': lambda: ClickState(
+            entities, clicks).get_buttons_clicked(),
+        'log_ingestion.parse': lambda: parse_log_lines(log_lines),
+        'log_ingestion.parse_files_serial': lambda: parse_log_files(log_files, processes=1),
+        'log_ingestion.parse_files_parallel': lambda: parse_log_files(
+            log_files, chunk_bytes=2 ** 20),
+        'log_ingestion.parse_and_insert': rolled_back(db, ingest_logs),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_file):
+    """
+    print the median time of each benchmark against a previous run
+    """
+    with open(previous_file) as f:
+        previous = json.load(f)['results']
+    print(f'{"benchmark":45s} {"before":>10s} {"after":>10s} {"ratio":>7s}')
+    for name, stats in results.items():
+        if name not in previous:
+            continue
+        before = previous[name]['median']
+        after = stats['median']
+        print(f'{name:45s} {before:10.4f} {after:10.4f} {after / before:7.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--load', help='load a synthetic dataset first (truncates tables!)',
+                        action='store_true', default=False)
+    parser.add_argument('--releases', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=2000)
+    parser.add_argument('--labels', type=int, default=300)
+    parser.add_argument('--days', help='days of marketplace history', type=int, default=730)
+    parser.add_argument('--samples_per_day', type=int, default=1)
+    parser.add_argument('--log_lines', type=int, default=20000)
+    parser.add_argument('--buttons', help='cards in the ClickState benchmark',
+                        type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help='run benchmarks whose name starts with this', default='')
+    parser.add_argument('--output', help='output json file (default: benchmarks/results/...)')
+    parser.add_argument('--compare', help='previous output json file to compare against')
+    args = parser.parse_args()
+    # pandas and plotly deprecation warnings would drown the results
+    warnings.simplefilter('ignore', FutureWarning)
+
+    run = {
+        'revision': git_revision(),
+        'started': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'args': vars(args)
+    }
+    if args.load:
+        print('loading synthetic dataset...')
+        run['load'] = load_dataset(DB, args)
+    run['dataset'] = dataset_size(DB)
+    run['results'] = {}
+    with tempfile.TemporaryDirectory() as log_dir:
+        for name, func in make_benchmarks(DB, args, log_dir).items():
+            if not name.startswith(args.only):
+                continue
+            run['results'][name] = stats = measure(func, args.repeat)
+            print(f'{name:45s} median {stats["median"]:.4f}s  min {stats["min"]:.4f}s')
+
+    output = args.output
+    if output is None:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        output = f'{RESULTS_DIR}/{stamp}_{run["revision"] or "unknown"}.json'
+    with open(output, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f'results written to {output}')
+    if args.compare:
+        compare(run['results'], args.compare)
+
+
+if __name__ == '__main__':
+    main()
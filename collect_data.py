@@ -1,9 +1,15 @@
-from util import Randomize, sleep_random
-from database.database_util import store_release_data
+from util import sleep_random
+from collector.engine import Collector
+from collector.scheduler import RefreshScheduler
+from collector.listings import ListingSnapshot, LISTINGS_MAX_AGE
+from collector.checkpoint import CheckpointStore
+from collector.rate_limit import DISCOGS_REQUESTS_PER_MINUTE
 from database.database_util_postgres import DBPostgreSQL
 from sql.schema import DB_KEYS_POSTGRES
 from discogs_identity import dclient
+from discogs_cache import install_response_cache
 import argparse
+import logging
 
 
 parser = argparse.ArgumentParser()
@@ -17,25 +23,82 @@ parser.add_argument(
 
 parser.add_argument(
     "--sleep",
-    help="expected value of sleep time (exponential distribution)",
+    help="expected value of sleep time between passes over the collection (exponential distribution)",
     type=float,
     default=5,
 )
 
+parser.add_argument(
+    "--workers",
+    help="number of threads making API requests",
+    type=int,
+    default=4,
+)
+
+parser.add_argument(
+    "--rpm",
+    help="discogs API requests per minute shared by all workers",
+    type=float,
+    default=DISCOGS_REQUESTS_PER_MINUTE,
+)
+
+parser.add_argument(
+    "--batch_size",
+    help="number of releases written to the database at once",
+    type=int,
+    default=50,
+)
+
+parser.add_argument(
+    "--budget",
+    help="number of releases to refresh per pass, most urgent first (default: all)",
+    type=int,
+    default=None,
+)
+
+parser.add_argument(
+    "--list_refresh",
+    help="hours between relisting the collection and wantlist from the API",
+    type=float,
+    default=LISTINGS_MAX_AGE / 3600,
+)
+
+parser.add_argument(
+    "--fresh_hours",
+    help="skip releases stored within this many hours, also across restarts",
+    type=float,
+    default=1,
+)
+
+parser.add_argument(
+    "--debug",
+    help="turn on debug output, including the API requests each release costs",
+    action="store_true",
+    default=False,
+)
+
 args = parser.parse_args()
+logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
 
 # -----------------------------------------------------------------------------
 # - Store collection info -----------------------------------------------------
 # -----------------------------------------------------------------------------
 
+# every pass samples prices, so marketplace stats are always revalidated
+install_response_cache(dclient, marketplace_ttl=0)
 db = DBPostgreSQL(DB_KEYS_POSTGRES)
+collector = Collector(
+    db, dclient,
+    store_metadata=args.store_meta,
+    workers=args.workers,
+    requests_per_minute=args.rpm,
+    batch_size=args.batch_size,
+    checkpoint=CheckpointStore(),
+)
+scheduler = RefreshScheduler(db)
+listings = ListingSnapshot(dclient, max_age=args.list_refresh * 3600)
 
 while True:
-    wantlist = dclient.identity().wantlist
-    collection = dclient.identity().collection_folders[0].releases
-    for clx in (collection, wantlist):
-        for item in Randomize(clx):
-            store_release_data(
-                db=db, release=item.release, store_metadata=args.store_meta
-            )
-            sleep_random(args.sleep)
+    releases = collector.skip_fresh(listings.releases(), args.fresh_hours * 3600)
+    collector.run(scheduler.order(releases, budget=args.budget))
+    sleep_random(args.sleep)
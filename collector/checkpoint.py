@@ -0,0 +1,78 @@
+import time
+from discogs_cache import api_scoped_path
+from sqlite_store import SqliteStore
+
+
+CHECKPOINT_FILE = 'cache/checkpoints.sqlite'
+
+
+class CheckpointStore(SqliteStore):
+    def __init__(self, path=None):
+        """
+        durable record of job progress, kept in a local sqlite file
+        stores when each release was last fetched by a job and a cursor per job,
+        so a crashed or redeployed job can pick up where it stopped
+        :param path: sqlite file name, defaults to CHECKPOINT_FILE scoped to the discogs API
+        """
+        if path is None:
+            path = api_scoped_path(CHECKPOINT_FILE)
+        super().__init__(path, schema=(
+            'CREATE TABLE IF NOT EXISTS fetched ('
+            'job TEXT NOT NULL, release_id INTEGER NOT NULL, fetched_at REAL NOT NULL, '
+            'PRIMARY KEY (job, release_id))',
+            'CREATE TABLE IF NOT EXISTS cursor (job TEXT PRIMARY KEY, position TEXT)'
+        ))
+
+    def mark_fetched(self, job, release_ids, when=None):
+        """
+        record that releases were fetched and stored
+        :param job: job name
+        :param release_ids: iterable of release ids
+        :param when: unix time, defaults to now
+        :return: None
+        """
+        if when is None:
+            when = time.time()
+        with self.transaction() as con:
+            con.executemany(
+                'INSERT INTO fetched (job, release_id, fetched_at) VALUES (?, ?, ?) '
+                'ON CONFLICT (job, release_id) DO UPDATE SET fetched_at = excluded.fetched_at',
+                [(job, int(release_id), when) for release_id in release_ids])
+        return None
+
+    def fresh_ids(self, job, window):
+        """
+        :param job: job name
+        :param window: seconds
+        :return: set of release ids fetched by the job within the last window seconds
+        """
+        rows = self.fetchall(
+            'SELECT release_id FROM fetched WHERE job = ? AND fetched_at >= ?',
+            (job, time.time() - window))
+        return {row[0] for row in rows}
+
+    def get_cursor(self, job, default=None):
+        """
+        :param job: job name
+        :param default: returned when the job has no cursor
+        :return: str, the saved cursor position
+        """
+        row = self.fetchone('SELECT position FROM cursor WHERE job = ?', (job,))
+        return default if row is None else row[0]
+
+    def set_cursor(self, job, position):
+        """
+        save a job's position; None clears it
+        :param job: job name
+        :param position: str (or anything with a str form), None to clear
+        :return: None
+        """
+        with self.transaction() as con:
+            if position is None:
+                con.execute('DELETE FROM cursor WHERE job = ?', (job,))
+            else:
+                con.execute(
+                    'INSERT INTO cursor (job, position) VALUES (?, ?) '
+                    'ON CONFLICT (job) DO UPDATE SET position = excluded.position',
+                    (job, str(position)))
+        return None
@@ -0,0 +1,88 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from database.database_util import prepare_release_frames, ReleaseBatch
+from collector.rate_limit import TokenBucket, install_rate_limiter, DISCOGS_REQUESTS_PER_MINUTE
+
+
+class Collector(object):
+    def __init__(self, db, client, store_metadata=False, workers=4,
+                 requests_per_minute=DISCOGS_REQUESTS_PER_MINUTE,
+                 batch_size=50, flush_seconds=30, checkpoint=None, job='collect_data'):
+        """
+        fetch releases from the discogs API concurrently and store them in batches
+        API requests from all workers share one token bucket; writes happen on
+        the calling thread through a single ReleaseBatch
+        :param db: database object
+        :param client: discogs_client.Client
+        :param store_metadata: if True, store release, artist, label data too
+        :param workers: number of threads making API requests
+        :param requests_per_minute: API request budget
+        :param batch_size: releases per database write
+        :param flush_seconds: longest time a fetched release waits to be written
+        :param checkpoint: CheckpointStore; releases are marked fetched once written
+        :param job: job name used in the checkpoint store
+        """
+        self.store_metadata = store_metadata
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.job = job
+        self.limiter = TokenBucket(requests_per_minute)
+        install_rate_limiter(client, self.limiter)
+        self.writer = ReleaseBatch(db, batch_size, flush_seconds, on_flush=self._mark_fetched)
+
+    def _mark_fetched(self, release_ids):
+        if self.checkpoint is not None:
+            self.checkpoint.mark_fetched(self.job, release_ids)
+        return None
+
+    def skip_fresh(self, releases, window):
+        """
+        drop releases this job stored within the last window seconds
+        :param releases: iterable of discogs_client.Release objects
+        :param window: seconds, None or 0 to keep everything
+        :return: generator of releases
+        """
+        fresh = set()
+        if self.checkpoint is not None and window:
+            fresh = self.checkpoint.fresh_ids(self.job, window)
+        return (release for release in releases if release.id not in fresh)
+
+    def fetch(self, release):
+        """
+        make the API requests for one release and prepare its rows
+        :param release: discogs_client.Release object
+        :return: dict, table name -> data frame, or None if the release failed
+        """
+        try:
+            return prepare_release_frames(release, self.store_metadata)
+        except Exception as e:
+            logging.warning(f'failed to fetch release {release.id}: {e}')
+            return None
+
+    def run(self, releases):
+        """
+        fetch and store every release
+        at most 2 x workers releases are in flight so lazy iterables stay lazy
+        :param releases: iterable of discogs_client.Release objects
+        :return: int, number of releases stored
+        """
+        n_stored = 0
+        in_flight = {}  # future -> release id
+        releases = iter(releases)
+        with ThreadPoolExecutor(self.workers) as pool:
+            while True:
+                for release in releases:
+                    in_flight[pool.submit(self.fetch, release)] = release.id
+                    if len(in_flight) >= 2 * self.workers:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    release_id = in_flight.pop(future)
+                    frames = future.result()
+                    if frames is not None:
+                        self.writer.add(frames, key=release_id)
+                        n_stored += 1
+        self.writer.flush()
+        return n_stored
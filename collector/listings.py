@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import logging
+from discogs_cache import api_scoped_path
+
+
+LISTINGS_FILE = 'cache/discogs_listings.json'
+LISTINGS_MAX_AGE = 24 * 3600  # seconds before the collection and wantlist are relisted
+DISCOGS_MAX_PER_PAGE = 100
+
+
+class ListingSnapshot(object):
+    def __init__(self, client, path=None, max_age=LISTINGS_MAX_AGE):
+        """
+        local copy of which releases are in the collection and wantlist
+        the listings are paginated API calls; keeping them on disk means each pass
+        over the collection costs no requests until the snapshot expires
+        :param client: discogs_client.Client
+        :param path: json file holding the snapshot, defaults to LISTINGS_FILE scoped
+            to the discogs API
+        :param max_age: seconds a snapshot stays valid
+        """
+        self.client = client
+        self.path = path if path is not None else api_scoped_path(LISTINGS_FILE)
+        self._username = None
+        self.max_age = max_age
+        self._data = None
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, data):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        return None
+
+    def _fetch(self):
+        """
+        list the collection and wantlist through the API
+        :return: dict with fetched (unix time), collection and wantlist (release ids)
+        """
+        identity = self.client.identity()
+        self._username = identity.username
+        output = {'fetched': time.time(), 'username': identity.username}
+        listings = {
+            'collection': identity.collection_folders[0].releases,
+            'wantlist': identity.wantlist
+        }
+        for name, items in listings.items():
+            items.per_page = DISCOGS_MAX_PER_PAGE
+            output[name] = [item.release.id for item in items]
+        logging.info(
+            f"listed {len(output['collection'])} collection and "
+            f"{len(output['wantlist'])} wantlist releases")
+        return output
+
+    @property
+    def username(self):
+        # the user the client is authenticated as, asked once
+        if self._username is None:
+            self._username = self.client.identity().username
+        return self._username
+
+    @property
+    def expired(self):
+        return self._data is None or time.time() - self._data['fetched'] > self.max_age
+
+    def refresh(self, force=False):
+        """
+        relist from the API if the snapshot is missing, expired, belongs to another
+        user, or force is True
+        :return: None
+        """
+        if self._data is None:
+            self._data = self._load()
+            if self._data is not None and self._data.get('username') != self.username:
+                logging.info(f"listings snapshot is for {self._data.get('username')}, relisting")
+                self._data = None
+        if force or self.expired:
+            self._data = self._fetch()
+            self._save(self._data)
+        return None
+
+    def release_ids(self):
+        """
+        :return: list of release ids in the collection followed by the wantlist
+        """
+        self.refresh()
+        return self._data['collection'] + self._data['wantlist']
+
+    def releases(self):
+        """
+        Release objects for the snapshot; they hold only an id and make no
+        request until an attribute is read
+        :return: list of discogs_client.Release objects
+        """
+        return [self.client.release(release_id) for release_id in self.release_ids()]
@@ -0,0 +1,104 @@
+import time
+import threading
+from discogs_cache import CachingFetcher
+
+
+DISCOGS_REQUESTS_PER_MINUTE = 60  # authenticated request budget per moving minute
+DISCOGS_RESERVE = 5  # requests left in the window for the dashboard and other clients
+
+
+class TokenBucket(object):
+    def __init__(self, requests_per_minute=DISCOGS_REQUESTS_PER_MINUTE, burst=None,
+                 reserve=DISCOGS_RESERVE):
+        """
+        thread-safe token bucket limiting the rate of API requests
+        :param requests_per_minute: sustained request rate
+        :param burst: maximum number of requests allowed back to back,
+            defaults to five seconds' worth of requests
+        :param reserve: slow down when the server reports this many requests
+            or fewer remaining in its window
+        """
+        self.rate = requests_per_minute / 60.
+        self.capacity = burst if burst is not None else max(1., self.rate * 5)
+        self.reserve = reserve
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        block until a request may be sent
+        :return: float, seconds spent waiting
+        """
+        waited = 0.
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def observe(self, remaining=None, limit=None):
+        """
+        adjust to the rate limit headers of the last response
+        :param remaining: X-Discogs-Ratelimit-Remaining, requests left in the window
+        :param limit: X-Discogs-Ratelimit, size of the window in requests
+        :return: None
+        """
+        with self._lock:
+            if limit is not None:
+                self.rate = min(self.rate, int(limit) / 60.)
+            if remaining is not None and int(remaining) <= self.reserve:
+                # the window is nearly spent (other clients share the key):
+                # go into debt so the next requests wait for it to drain
+                self._refill()
+                self.tokens = min(self.tokens, int(remaining) - self.reserve)
+        return None
+
+
+class RateLimitedFetcher(object):
+    def __init__(self, fetcher, limiter):
+        """
+        wrap a discogs_client fetcher so every HTTP request waits on a limiter
+        :param fetcher: the client's fetcher (client._fetcher)
+        :param limiter: TokenBucket
+        """
+        self.fetcher = fetcher
+        self.limiter = limiter
+
+    def fetch(self, *args, **kwargs):
+        self.limiter.acquire()
+        output = self.fetcher.fetch(*args, **kwargs)
+        self.limiter.observe(
+            remaining=getattr(self.fetcher, 'rate_limit_remaining', None),
+            limit=getattr(self.fetcher, 'rate_limit', None))
+        return output
+
+    def __getattr__(self, name):
+        return getattr(self.fetcher, name)
+
+
+def install_rate_limiter(client, limiter):
+    """
+    route all requests made by a discogs_client.Client through a limiter
+    the limiter goes beneath a response cache so cache hits cost no tokens
+    :param client: discogs_client.Client
+    :param limiter: TokenBucket
+    :return: client
+    """
+    parent = client
+    if isinstance(client._fetcher, CachingFetcher):
+        parent = client._fetcher
+    if isinstance(parent._fetcher, RateLimitedFetcher):
+        parent._fetcher.limiter = limiter
+    else:
+        parent._fetcher = RateLimitedFetcher(parent._fetcher, limiter)
+    return client
@@ -0,0 +1,77 @@
+import heapq
+from datetime import datetime, timedelta, timezone
+from math import log1p
+from database.database_util import get_refresh_stats
+
+
+class RefreshScheduler(object):
+    def __init__(self, db, window_days=30, volatility_weight=10., supply_weight=.5):
+        """
+        decide which releases to fetch next
+        a release's priority is the hours since its last sample, scaled up by how
+        much its price has moved recently and by how many copies are for sale.
+        releases with no sample in the window come first.
+        :param db: DBPostgreSQL object
+        :param window_days: days of history used to measure each release
+        :param volatility_weight: weight of the coefficient of variation of the daily price
+        :param supply_weight: weight of log(1 + number for sale)
+        """
+        self.db = db
+        self.window_days = window_days
+        self.volatility_weight = volatility_weight
+        self.supply_weight = supply_weight
+        self._stats = {}
+
+    def refresh(self):
+        """
+        reload the ranking inputs from the database
+        :return: None
+        """
+        since = datetime.now(timezone.utc) - timedelta(days=self.window_days)
+        stats = get_refresh_stats(self.db, since)
+        self._stats = {
+            row.release_id: (row.last_sampled, row.volatility, row.num_for_sale)
+            for row in stats.itertuples(index=False)}
+        return None
+
+    def priority(self, release_id, now=None):
+        """
+        :param release_id: release id
+        :param now: datetime, defaults to now
+        :return: float, larger means fetch sooner
+        """
+        if now is None:
+            now = datetime.now(timezone.utc)
+        last_sampled, volatility, num_for_sale = self._stats.get(release_id, (None, 0., 0.))
+        if last_sampled is None or last_sampled != last_sampled:  # never sampled or NaT
+            return float('inf')
+        staleness = max(0., (now - last_sampled).total_seconds() / 3600)
+        return (
+            staleness
+            * (1 + self.volatility_weight * volatility)
+            * (1 + self.supply_weight * log1p(num_for_sale)))
+
+    def order(self, releases, budget=None, reload=True):
+        """
+        yield releases from a priority queue, most urgent first
+        :param releases: iterable of discogs_client.Release objects (duplicates are dropped)
+        :param budget: maximum number of releases to yield, None for all
+        :param reload: if True, reload the ranking inputs first
+        :return: generator of releases
+        """
+        if reload:
+            self.refresh()
+        now = datetime.now(timezone.utc)
+        queue = []
+        seen = set()
+        for seq, release in enumerate(releases):
+            if release.id in seen:
+                continue
+            seen.add(release.id)
+            queue.append((-self.priority(release.id, now), seq, release))
+        heapq.heapify(queue)
+        n = 0
+        while queue and (budget is None or n < budget):
+            _, _, release = heapq.heappop(queue)
+            n += 1
+            yield release
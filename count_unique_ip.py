@@ -1,39 +1,30 @@
-from database.database_util import DB_KEYS_POSTGRES
+import argparse
+from sql.schema import DB_KEYS_POSTGRES
 from database.database_util_postgres import DBPostgreSQL
-from datetime import datetime, timezone
-import pandas as pd
-import re
+from collector.checkpoint import CheckpointStore
+from access_logs.ingest import LOG_FILE, ingest_log, backfill_log
+from access_logs.sketches import TrafficSketches
 
-DB = DBPostgreSQL(DB_KEYS_POSTGRES)
+# LOG_FILE = "access.log"
 
-logfile = "/var/log/nginx/access.log"
-# logfile = "access.log"
 
-log_data = []
-R0 = r"^([\d.]+) (\S+) (\S+) \[([\w:/]+\s[+-]\d{4})\] \"(.+?)\" (\d{3}) (\d+) \"([^\"]+)\" \"(.+?)\""
-with open(logfile, "r") as f:
-    lines = f.readlines()
-    for line in lines:
-        s = re.search(R0, line)
-        ts = datetime.strptime(s.group(4).split(' ')[0], '%d/%b/%Y:%H:%M:%S')
-        ts = ts.replace(tzinfo=timezone.utc)
-        log_data.append({
-            'ip': s.group(1),
-            'timestamp': ts,
-            'request': s.group(5),
-            'status': s.group(6),
-            'length': s.group(7),
-            'host': s.group(8),
-            'user_agent': s.group(9)
-        })
-        
-log_data = pd.DataFrame(log_data)
-
-DB.insert_rows(df=log_data, tbl='nginx', schema='logs')
-unique_ips = log_data.ip.drop_duplicates().sort_values().values.tolist()
-
-print({'unique_ips': len(unique_ips)})
-print({'ips': unique_ips})
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--log_file', default=LOG_FILE)
+    parser.add_argument('--backfill', help='first run: parse the rotated logs too, on a process pool',
+                        action='store_true', default=False)
+    parser.add_argument('--processes', type=int, default=None, help='pool size for --backfill')
+    args = parser.parse_args()
 
+    DB = DBPostgreSQL(DB_KEYS_POSTGRES)
+    sketches = TrafficSketches()
 
+    if args.backfill:
+        n_lines = backfill_log(DB, args.log_file, checkpoint=CheckpointStore(),
+                               processes=args.processes, on_batch=sketches.update)
+    else:
+        # only the lines written since the last run are read, stored and added to the sketches
+        n_lines = ingest_log(DB, args.log_file, checkpoint=CheckpointStore(), on_batch=sketches.update)
 
+    print({'new_lines': n_lines})
+    print(sketches.report())
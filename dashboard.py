@@ -18,11 +18,13 @@ from dashboard.layout import (
 )
 from discogs_identity import dclient as client
 from dashboard.plotter import make_artist_plot, make_timeseries_plot
+from metrics import instrument_callback, register_metrics_endpoint
 
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 app.title = "Collection Analyser 2.0.0"
 app.layout = main_layout  # page_layout
+register_metrics_endpoint(app.server)
 
 
 @app.callback(
@@ -32,6 +34,7 @@ app.layout = main_layout  # page_layout
     Input('analyze_button', 'n_clicks'),
     Input('axis_type', 'value'),
     Input('measure', 'value'))
+@instrument_callback
 def update_graph1(n, at, measure):
     if not n:
         raise PreventUpdate
@@ -49,6 +52,7 @@ def update_graph1(n, at, measure):
     Input("graph2_options", "value"),
     State({"object": "card_store", "field": ALL, "value": ALL}, "data"),
 )
+@instrument_callback
 def create_music_relationship_graph(card_clicks, y_var, card_data):
     # conditions = get_buttons_clicked(card_data, card_clicks)
     clickstate = ClickState(entities=card_data, clicks=card_clicks)
@@ -65,6 +69,7 @@ def create_music_relationship_graph(card_clicks, y_var, card_data):
     Output('music_relationship_plot', 'figure'),
     Input({'type': 'button', 'entity': ALL}, 'n_clicks')
 )
+@instrument_callback
 def create_music_relationship_graph(n_):
     pass
 
@@ -76,6 +81,7 @@ def create_music_relationship_graph(n_):
               Input('search_box', 'value'),
               State('graph1_custom_data', 'data'),
               State('graph1_entity', 'data'))
+@instrument_callback
 def add_cards(traces, search, custom_data_columns, entity):
     """
     generate dash bootstrap cards to represent a selection of point
@@ -101,6 +107,7 @@ def add_cards(traces, search, custom_data_columns, entity):
 @app.callback(Output('release_card_col', 'children'),
               Input('graph2', 'clickData'),
               State('graph2_custom_data', 'data'))
+@instrument_callback
 def show_release_card(clickdata, customdata):
     """
     Create album card when user clicks a point on graph2
@@ -123,6 +130,7 @@ def show_release_card(clickdata, customdata):
     Input("search_button", "n_clicks"),
     State("search_text", "value"),
 )
+@instrument_callback
 def make_search(n, txt):
     if not n:
         raise PreventUpdate
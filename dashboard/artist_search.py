@@ -0,0 +1,172 @@
+import re
+import time
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from services import SERVICES
+
+
+ARTIST_INDEX_TTL = 3600  # seconds before the index is rebuilt from the artists table
+SEARCH_LIMIT = 20  # options returned per search
+PREFIX_SCAN_LIMIT = 2000  # prefix entries ranked per search, bounds one-letter queries
+WORD_START = re.compile(r'(?:^|(?<=[\s\-/&(.,]))\w')
+
+
+def normalize(text):
+    """
+    :param text: str
+    :return: str, case folded, accents removed, whitespace collapsed
+    """
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ArtistIndex(object):
+    def __init__(self, load=None, ttl=ARTIST_INDEX_TTL):
+        """
+        in-memory search over artist names, built on first use and rebuilt after ttl
+        in a background thread, while searches keep using the old index
+        names are matched by prefix, by the prefix of any word, then (for three or
+        more characters) anywhere through a trigram index
+        :param load: function returning a data frame with artist_id and name,
+            defaults to reading the artists table
+        :param ttl: seconds
+        """
+        self.load = load if load is not None else self._read_artists
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # held by the one thread building the index
+        self._built_at = None
+        self._names = []  # (artist_id, name, normalized name)
+        self._prefixes = []  # sorted (text from a word start, position, entry)
+        self._keys = []  # first element of each _prefixes entry, for bisect
+        self._trigrams = {}  # trigram -> set of entries
+
+    @staticmethod
+    def _read_artists():
+        return SERVICES.get('db').read_rows('artists', columns=['artist_id', 'name'])
+
+    def build(self):
+        """
+        (re)build the index from load()
+        :return: int, number of artists indexed
+        """
+        df = self.load()
+        names = []
+        prefixes = []
+        grams = defaultdict(set)
+        for artist_id, name in zip(df.artist_id.tolist(), df.name.tolist()):
+            if not name:
+                continue
+            key = normalize(name)
+            entry = len(names)
+            names.append((artist_id, name, key))
+            for match in WORD_START.finditer(key):
+                prefixes.append((key[match.start():], match.start(), entry))
+            for gram in trigrams(key):
+                grams[gram].add(entry)
+        prefixes.sort()
+        with self._lock:
+            self._names = names
+            self._prefixes = prefixes
+            self._keys = [p[0] for p in prefixes]
+            self._trigrams = dict(grams)
+            self._built_at = time.monotonic()
+        return len(names)
+
+    def _expired(self):
+        return time.monotonic() - self._built_at > self.ttl
+
+    def _rebuild(self):
+        try:
+            if self._expired():
+                self.build()
+        except Exception:
+            logging.exception('artist index rebuild failed, keeping the old index')
+        finally:
+            self._build_lock.release()
+
+    def _ensure_built(self):
+        if self._built_at is None:
+            # nothing to search yet: the first caller builds, the others wait for it
+            with self._build_lock:
+                if self._built_at is None:
+                    self.build()
+        elif self._expired() and self._build_lock.acquire(blocking=False):
+            threading.Thread(target=self._rebuild, name='artist-index-rebuild', daemon=True).start()
+        return None
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """
+        :param query: str, typed text
+        :param limit: number of results
+        :return: list of (artist_id, name), best first: names starting with the
+            query, then names with a word starting with it, then other matches
+        """
+        q = normalize(query)
+        if not q:
+            return []
+        self._ensure_built()
+        with self._lock:
+            names, prefixes, keys, grams = self._names, self._prefixes, self._keys, self._trigrams
+        ranked = {}
+        idx = bisect_left(keys, q)
+        for key, position, entry in prefixes[idx:idx + PREFIX_SCAN_LIMIT]:
+            if not key.startswith(q):
+                break
+            rank = (0 if position == 0 else 1, position, len(names[entry][2]), names[entry][2])
+            if entry not in ranked or rank < ranked[entry]:
+                ranked[entry] = rank
+        if len(ranked) < limit and len(q) >= 3:
+            postings = sorted((grams.get(gram, set()) for gram in trigrams(q)), key=len)
+            candidates = set.intersection(*postings) if postings else set()
+            for entry in candidates - set(ranked):
+                key = names[entry][2]
+                position = key.find(q)
+                if position >= 0:
+                    ranked[entry] = (2, position, len(key), key)
+        best = sorted(ranked, key=ranked.get)[:limit]
+        return [(names[entry][0], names[entry][1]) for entry in best]
+
+
+ARTIST_INDEX = ArtistIndex()
+
+
+def artist_option(artist_id, name):
+    """
+    :return: dict, a main_dropdown option
+    """
+    return {'label': name, 'value': {'id': artist_id, 'name': name}}
+
+
+def search_artist_options(query, limit=SEARCH_LIMIT, index=ARTIST_INDEX):
+    """
+    :param query: str, typed text
+    :return: list of main_dropdown options, best matches first
+    """
+    return [artist_option(artist_id, name) for artist_id, name in index.search(query, limit)]
+
+
+def register_search_endpoint(server, path='/search/artists', index=ARTIST_INDEX):
+    """
+    serve artist search from a flask server: GET path?q=<text>&limit=<n>
+    :param server: flask.Flask
+    :param path: url of the endpoint
+    :return: None
+    """
+    from flask import request, jsonify
+
+    def search_artists():
+        limit = min(request.args.get('limit', SEARCH_LIMIT, type=int), 100)
+        results = index.search(request.args.get('q', ''), limit)
+        return jsonify([{'artist_id': artist_id, 'name': name} for artist_id, name in results])
+
+    server.add_url_rule(path, 'search_artists', search_artists)
+    return None
@@ -1,7 +1,7 @@
 # a class to manage image caching
 
-from database.database_util_postgres import DBPostgreSQL
-from sql.schema import DB_KEYS_POSTGRES, ALL_TABLES, ALL_ENT
+from services import SERVICES
+from sql.schema import ALL_TABLES, ALL_ENT
 from urllib.request import urlretrieve
 from urllib.error import HTTPError
 from dash import get_asset_url
@@ -12,7 +12,8 @@ import logging
 
 class ImageCache(object):
     def __init__(self):
-        self.db = DBPostgreSQL(DB_KEYS_POSTGRES)
+        # the shared database object; one per card would mean a pool lookup per card
+        self.db = SERVICES.lazy('db')
         for entity in ALL_ENT:
             if not os.path.isdir(f'assets/{entity}'):
                 os.mkdir(f'assets/{entity}')
@@ -31,9 +32,8 @@ class ImageCache(object):
     def get_discogs_image_url(self, entity, id_val):
         tbl, id_col = self.get_table_name(entity)
         id_val = int(id_val)
-        output = self.db._query(
-            f"select image from public.{tbl} where {id_col} = {id_val};")
-        image_url = output[0][0]
+        output = self.db.read_rows(tbl, columns=['image'], limit=1, **{id_col: [id_val]})
+        image_url = output.image[0]
         return image_url
 
     @staticmethod
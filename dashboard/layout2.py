@@ -2,12 +2,13 @@ from dashboard.image_cache import ImageCache
 import dash_bootstrap_components as dbc
 from dash import html, dcc, get_asset_url
 from discogs_identity import dclient
-from database.database_util_postgres import DBPostgreSQL
-from sql.schema import DB_KEYS_POSTGRES
+from services import SERVICES
 from dashboard.plotter import make_timeseries_plot
+from result_cache import memoize
 
 
-DB = DBPostgreSQL(DB_KEYS_POSTGRES)
+DB = SERVICES.lazy('db')
+ARTIST_CARD_TTL = 24 * 3600  # the discogs profile and image change rarely
 
 
 def make_button(text, btn_id):
@@ -16,14 +17,6 @@ def make_button(text, btn_id):
         id=btn_id, color='secondary', style={'width':'20vw'})
 
 
-def get_artist_options():
-    tbl = DB.read_rows('artists')
-    return [
-        {'label': row['name'], 'value': {'id': row.artist_id, 'name': row['name']}}
-        for idx, row in tbl.iterrows()
-    ]
-
-
 MAIN_LAYOUT = dbc.Container([
     dbc.Row([
         html.H1('Vinyl Collection Analyser', className='text-center page-cell')
@@ -31,7 +24,8 @@ MAIN_LAYOUT = dbc.Container([
     dbc.Row([
         dcc.Dropdown(
             id='main_dropdown', 
-            options=get_artist_options(), 
+            # filled as the user types, by the search_artists callback in app.py
+            options=[], 
             placeholder='Select Artist'),
         dcc.Store(id='dropdown_entity')
     ], class_name='page_cell'),
@@ -48,6 +42,7 @@ MAIN_LAYOUT = dbc.Container([
 
 
 
+@memoize('artist_card', ttl=ARTIST_CARD_TTL)
 def make_artist_card(v):
     # create artist card using information from the discogs API
     # v: dict, a dropdown value
@@ -1,13 +1,16 @@
 from plotly.graph_objects import Figure
 import plotly.express as px
-from database.database_util import get_price_data
-from datetime import datetime
-from database.database_util_postgres import DBPostgreSQL
-from sql.schema import DB_KEYS_POSTGRES
+from database.database_util import get_daily_price_data, get_price_summary
+import time
+from functools import wraps
+from metrics import METRICS
+from result_cache import memoize, release_tags, condition_tags
+from services import SERVICES
+from dashboard.plotter_util import resample_daily
 import pandas as pd
 
 
-DB = DBPostgreSQL(DB_KEYS_POSTGRES)
+DB = SERVICES.lazy('db')
 
 
 LAYOUT_STYLE = dict(
@@ -40,11 +43,12 @@ YAXIS_MONEY_FORMAT = dict(
 
 
 def timeit(func):
+    # record the latency of func in the function_seconds histogram of /metrics
+    @wraps(func)
     def func_(*args, **kwargs):
-        t1 = datetime.now()
+        t1 = time.perf_counter()
         output = func(*args, **kwargs)
-        t2 = datetime.now()
-        print(f'Query took {t2 - t1}')
+        METRICS.observe('function_seconds', time.perf_counter() - t1, function=func.__name__)
         return output
     return func_
 
@@ -59,14 +63,7 @@ def aggregate_prices(groupings, x_measure, y_measure, central_id, **conditions):
     :param conditions:
     :return: grouped data frame with price summary
     """
-    return (
-        get_price_data(db=DB,**conditions)
-        .groupby(groupings)
-        .agg({
-            'lowest_price': y_measure,
-            'num_for_sale': x_measure,
-            'title': lambda x: x.nunique()
-        }).rename(columns={'title': 'count'}))
+    return get_price_summary(DB, groupings, x_measure, y_measure, **conditions)
 
 
 def agg_plot(
@@ -225,15 +222,28 @@ def make_album_plot(x_measure='median', y_measure='median', **conditions):
 # -----------------------------------------------------------------------------
 
 
+def timeseries_tags(output, color_var, y_var='lowest_price', **conditions):
+    # the releases plotted, whatever the filter, and the entities filtered on,
+    # so new prices or a new release of a plotted artist invalidate the plot
+    fig, custom_data = output
+    col = custom_data.index('release_id')
+    release_ids = [
+        row[col] for trace in fig.data if trace.customdata is not None
+        for row in trace.customdata]
+    return release_tags(release_ids) + condition_tags(conditions)
+
+
+@memoize('timeseries_plot', tags=timeseries_tags)
 def make_timeseries_plot(color_var, y_var='lowest_price', **conditions):
     """
     Generate a time series plot of record values
+    reads the daily price rollup, so the data size grows with days rather than samples
     :param color_var: ui uses values from ENTITY_OPTIONS: (country, label, artist, album)
     :param y_var: 'lowest_price' or 'num_for_sale'
     :param conditions:
     :return:
     """
-    df = get_price_data(db=DB, **conditions)
+    df = get_daily_price_data(db=DB, **conditions)
     df = df.assign(when=pd.to_datetime(df.when, utc=True).dt.tz_localize(None))
     release_versions = (
         df[['release_id', 'title', 'catno', 'year', 'country',
@@ -241,21 +251,11 @@ def make_timeseries_plot(color_var, y_var='lowest_price', **conditions):
         .drop_duplicates()
         .reset_index(drop=True)
     )
-    df_list = []
-    for r in release_versions.release_id:
-        df_list.append(
-            df[df.release_id.eq(r)]
-            .set_index('when')
-            .resample('24H')
-            .agg({
-                'lowest_price': 'min',
-                'num_for_sale': 'max'
-            })
-            .reset_index()
-            .assign(release_id=r)
-        )
     df_agg = (
-        pd.concat(df_list, axis=0)
+        resample_daily(df, {
+            'lowest_price': 'min',
+            'num_for_sale': 'max'
+        })
         .merge(release_versions, on='release_id')
     )
     custom_data = [
@@ -1,4 +1,4 @@
-from numpy import where, array
+from numpy import where, array, arange, repeat
 import pandas as pd
 
 
@@ -17,6 +17,36 @@ def get_factor(attribute, traces, custom_data_labels):
     return condition
 
 
+def resample_daily(df, aggregations, time_col='when', group_col='release_id'):
+    """
+    bucket a long table of samples into days for every group at once
+    equivalent to resampling each group to '24H' separately: days without samples
+    between a group's first and last day are kept as rows of missing values
+    :param df: data frame with group_col, a tz-naive datetime time_col and measure columns
+    :param aggregations: dict, measure column -> aggregate name (e.g. {'lowest_price': 'min'})
+    :param time_col: name of the datetime column
+    :param group_col: name of the grouping column
+    :return: data frame with group_col, time_col and one column per measure
+    """
+    daily = (
+        df.assign(**{time_col: df[time_col].dt.floor('D')})
+        .groupby([group_col, time_col])
+        .agg(aggregations))
+    if daily.shape[0] == 0:
+        return daily.reset_index()
+    days = daily.index.get_level_values(time_col)
+    spans = pd.DataFrame({'day': days}, index=daily.index.get_level_values(group_col))
+    spans = spans.groupby(level=0)['day'].agg(['min', 'max'])
+    n_days = ((spans['max'] - spans['min']).dt.days + 1).values
+    starts = repeat(n_days.cumsum() - n_days, n_days)
+    offsets = pd.to_timedelta(arange(n_days.sum()) - starts, unit='D')
+    full_index = pd.MultiIndex.from_arrays([
+        repeat(spans.index.values, n_days),
+        repeat(spans['min'].values, n_days) + offsets
+    ], names=[group_col, time_col])
+    return daily.reindex(full_index).reset_index()
+
+
 class ClickState(object):
     def __init__(self, entities, clicks):
         """
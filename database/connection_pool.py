@@ -0,0 +1,196 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from database.instrumentation import MeteredConnection, MeteredCursor
+from metrics import METRICS
+
+
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 10
+POOL_IDLE_TIMEOUT = 300  # seconds a connection may sit unused before it is recycled
+POOL_PING_AFTER = 30  # seconds idle after which a connection is pinged before reuse
+POOL_CHECKOUT_TIMEOUT = 30  # seconds to wait for a free connection
+
+
+class ConnectionPool(object):
+    def __init__(self, cred, minconn=POOL_MIN_CONN, maxconn=POOL_MAX_CONN,
+                 idle_timeout=POOL_IDLE_TIMEOUT, health_check=True,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, ping_after=POOL_PING_AFTER):
+        """
+        thread-safe pool of postgres connections
+        :param cred: dict, keyword arguments for psycopg2.connect
+        returned connections are kept open for reuse, up to maxconn of them: psycopg2's
+        pool alone would keep only minconn and close every other one handed back,
+        so concurrent callbacks beyond minconn would connect and disconnect per query
+        :param minconn: number of connections opened up front
+        :param maxconn: maximum number of connections open at once
+        :param idle_timeout: seconds, connections idle longer than this are replaced
+        :param health_check: if True, ping a connection before handing it out when it
+            has been idle longer than ping_after; a connection that breaks in use is
+            dropped by connection() anyway
+        :param checkout_timeout: seconds to wait for a free connection before failing
+        :param ping_after: seconds
+        """
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.checkout_timeout = checkout_timeout
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+        self._pool = ThreadedConnectionPool(
+            minconn, maxconn, connection_factory=MeteredConnection, cursor_factory=MeteredCursor,
+            **cred)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # (connection, time it was returned), most recently used last; the connections
+        # opened up front start here, so _pool.getconn() only ever hands out new ones
+        self._idle = [(self._pool.getconn(), time.monotonic()) for _ in range(minconn)]
+
+    def _is_stale(self, conn, last_used=None):
+        if conn.closed:
+            return True
+        if last_used is None:  # just opened
+            return False
+        idle = time.monotonic() - last_used
+        if idle > self.idle_timeout:
+            return True
+        if self.health_check and idle > self.ping_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1;')
+                conn.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                return True
+        return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._pool.putconn(conn, close=True)
+
+    def _expired_idle(self):
+        """
+        take the connections idle longer than idle_timeout out of _idle; call with _lock held
+        _idle is in the order connections were returned, so they are at its start
+        :return: list of connections to discard
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        n = 0
+        while n < len(self._idle) and self._idle[n][1] < deadline:
+            n += 1
+        expired = [conn for conn, _ in self._idle[:n]]
+        del self._idle[:n]
+        return expired
+
+    def getconn(self):
+        """
+        check a healthy connection out of the pool, waiting for one if all are in use
+        :return: psycopg2 connection
+        """
+        t1 = time.perf_counter()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError(
+                f'no connection available after {self.checkout_timeout} seconds')
+        try:
+            while True:
+                with self._lock:
+                    # sweep on every checkout: under steady traffic the most recently used
+                    # connection is always reused and the others would never be checked
+                    expired = self._expired_idle()
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                    else:
+                        conn, last_used = self._pool.getconn(), None
+                for old in expired:
+                    self._discard(old)
+                if not self._is_stale(conn, last_used):
+                    METRICS.observe(
+                        'db_connection_wait_seconds', time.perf_counter() - t1, db='postgres')
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        """
+        return a connection to the pool
+        :param conn: connection from getconn
+        :param close: if True, close the connection instead of keeping it
+        :return: None
+        """
+        try:
+            if close or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+        return None
+
+    @contextmanager
+    def connection(self):
+        """
+        borrow a connection for one transaction
+        commits when the block exits normally and rolls back on error
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def closeall(self):
+        with self._lock:
+            # psycopg2 closes the idle connections too: they are still checked out of it
+            self._idle = []
+            self._pool.closeall()
+        return None
+
+
+# -----------------------------------------------------------------------------
+# - Shared pools --------------------------------------------------------------
+# -----------------------------------------------------------------------------
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(cred, **pool_options):
+    """
+    get the process-wide pool for a set of credentials, creating it on first use
+    every DBPostgreSQL object with the same credentials shares one pool.
+    pools are never shared across a fork, so gunicorn workers each get their own.
+    :param cred: dict, keyword arguments for psycopg2.connect
+    :param pool_options: keyword arguments for ConnectionPool, used only on creation
+    :return: ConnectionPool
+    """
+    key = tuple(sorted((k, str(v)) for k, v in cred.items()))
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = ConnectionPool(cred, **pool_options)
+            _POOLS[key] = pool
+    return pool
+
+
+def close_pools():
+    """
+    close every connection in every pool owned by this process
+    :return: None
+    """
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            if pool.pid == os.getpid():
+                pool.closeall()
+        _POOLS.clear()
+    return None
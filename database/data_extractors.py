@@ -1,3 +1,5 @@
+import threading
+from collections import OrderedDict
 import discogs_client
 import pandas as pd
 from util import just_try
@@ -12,11 +14,6 @@ def get_image_url(item):
     return item.images[0]['uri']
 
 
-@just_try
-def get_catno(release):
-    return release.labels[0].data['catno']
-
-
 @just_try
 def get_thumb_url(item):
     return item.thumb
@@ -36,31 +33,6 @@ def get_profile(item):
     return item.profile
 
 
-@just_try
-def get_country(release):
-    return release.country
-
-
-@just_try
-def get_year(release):
-    return release.year
-
-
-@just_try
-def get_format(release):
-    return release.formats[0]['name']
-
-
-@just_try
-def get_release_text(release):
-    return release.formats[0]['text']
-
-
-@just_try
-def get_master_id(release):
-    return release.master.id
-
-
 @just_try
 def get_lowest_price(stats):
     return stats.lowest_price.value
@@ -92,71 +64,170 @@ def prepare_price_data(release):
     return pd.DataFrame(output, index=[0])
 
 
-def prepare_release_data(release):
+# -----------------------------------------------------------------------------
+# - Extraction from raw release JSON ------------------------------------------
+# -----------------------------------------------------------------------------
+
+# keys every /releases/{id} response has; a release missing any of them holds
+# only basic data (collection listing, or just an id) and needs one refresh.
+# year, country, master_id and images may legitimately be absent.
+RELEASE_JSON_KEYS = ('title', 'formats', 'labels', 'artists')
+
+
+class EntityCache(object):
+    def __init__(self, max_size=10000):
+        """
+        bounded in-memory cache of artist and label details
+        keyed by (entity, id) so an artist or label is fetched at most once
+        :param max_size: number of entities kept, least recently used are evicted
+        """
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, entity, id_val):
+        with self._lock:
+            value = self._items.get((entity, id_val))
+            if value is not None:
+                self._items.move_to_end((entity, id_val))
+        return value
+
+    def put(self, entity, id_val, value):
+        with self._lock:
+            self._items[(entity, id_val)] = value
+            self._items.move_to_end((entity, id_val))
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return None
+
+    def lookup(self, client, entity, id_val, report=None):
+        """
+        image url and profile of an artist or label, fetched once then cached
+        :param client: discogs_client.Client
+        :param entity: 'artist' or 'label'
+        :param id_val: artist or label id
+        :param report: list, (entity, id, field) is appended when a request is made
+        :return: dict with image and profile
+        """
+        value = self.get(entity, id_val)
+        if value is None:
+            item = client.artist(id_val) if entity == 'artist' else client.label(id_val)
+            value = {'image': get_image_url(item), 'profile': get_profile(item)}
+            self.put(entity, id_val, value)
+            if report is not None:
+                report.append((entity, id_val, 'image'))
+        return value
+
+
+ENTITY_CACHE = EntityCache()
+
+
+def audit_release(release, cache=ENTITY_CACHE):
+    """
+    list the fields of a release that would cost an extra API request to read
+    :param release: Release object
+    :param cache: EntityCache consulted for artist and label details
+    :return: list of (entity, id, field)
+    """
+    output = [('release', release.id, key) for key in RELEASE_JSON_KEYS if key not in release.data]
+    for entity in ('artist', 'label'):
+        for item in release.data.get(f'{entity}s', []):
+            if cache.get(entity, item['id']) is None:
+                output.append((entity, item['id'], 'image'))
+    return output
+
+
+def get_release_json(release, report=None):
     """
-    produce data frame of release data from Release object
+    raw release JSON, refreshing the release once if fields are missing
+    (e.g. a release built from a collection listing or only an id)
     :param release: Release object
+    :param report: list, ('release', id, 'refresh') is appended when a request is made
+    :return: dict
+    """
+    if any(key not in release.data for key in RELEASE_JSON_KEYS):
+        release.refresh()
+        if report is not None:
+            report.append(('release', release.id, 'refresh'))
+    return release.data
+
+
+@just_try
+def get_json_value(data, *path):
+    for key in path:
+        data = data[key]
+    return data
+
+
+def prepare_release_data_json(data):
+    """
+    produce data frame of release data from raw release JSON
+    :param data: dict, /releases/{id} response
     :return: pandas data frame
     """
     output = {
-        'release_id': release.id,
-        'title': get_title(release),
-        'year': get_year(release),
-        'country': get_country(release),
-        'format': get_format(release),
-        'catno': get_catno(release),
-        'master_id': get_master_id(release),
-        'image': get_image_url(release),
-        'format_details': get_release_text(release)
+        'release_id': data['id'],
+        'title': data.get('title'),
+        'year': data.get('year'),
+        'country': data.get('country'),
+        'format': get_json_value(data, 'formats', 0, 'name'),
+        'catno': get_json_value(data, 'labels', 0, 'catno'),
+        'master_id': data.get('master_id'),
+        'image': get_json_value(data, 'images', 0, 'uri'),
+        'format_details': get_json_value(data, 'formats', 0, 'text')
     }
     return pd.DataFrame(output, index=[0])
 
 
-def prepare_label_data(release):
-    """
-    prepare the label information and release-label links
-    :param release: Release object
-    :return: dataframe, dataframe
-    """
-    rid = release.id
-    n_labels = len(release.labels)
-    labels = [{
-        'label_id': label.id,
-        'name': label.name,
-        'image': get_image_url(label)
-    } for label in release.labels]
-    label_release = [{
+def _prepare_entity_data_json(data, entity, client, cache, report, fetch_missing):
+    rid = data['id']
+    items = data.get(f'{entity}s', [])
+    rows = []
+    for item in items:
+        details = cache.get(entity, item['id'])
+        if details is None and fetch_missing:
+            details = cache.lookup(client, entity, item['id'], report)
+        elif details is None and report is not None:
+            report.append((entity, item['id'], 'image'))
+        rows.append({
+            f'{entity}_id': item['id'],
+            'name': item['name'],
+            'image': details['image'] if details else None
+        })
+    links = [{
         'release_id': rid,
-        'label_id': label['label_id'],
-        'label_rank': idx
-    } for idx, label in enumerate(labels)]
+        f'{entity}_id': row[f'{entity}_id'],
+        f'{entity}_rank': idx
+    } for idx, row in enumerate(rows)]
     return (
-        pd.DataFrame(label_release, index=range(n_labels)),
-        pd.DataFrame(labels, index=range(n_labels))
+        pd.DataFrame(links, index=range(len(rows))),
+        pd.DataFrame(rows, index=range(len(rows)))
     )
 
 
-def prepare_artist_data(release):
+def prepare_artist_data_json(data, client, cache=ENTITY_CACHE, report=None, fetch_missing=True):
     """
-    prepare the artist data and release/artist link data
-    :param release: Release object
+    prepare the artist data and release/artist link data from raw release JSON
+    artist images are not part of the release JSON; they come from the cache
+    :param data: dict, /releases/{id} response
+    :param client: discogs_client.Client used on a cache miss
+    :param cache: EntityCache
+    :param report: list collecting (entity, id, field) for every extra request
+        (or, with fetch_missing False, every request that was skipped)
+    :param fetch_missing: if False, leave images of uncached artists empty
     :return: dataframe, dataframe
     """
-    rid = release.id
-    artists = release.artists
-    n_artists = len(artists)
-    artists = [{
-        'artist_id': artist.id,
-        'name': artist.name,
-        'image': get_image_url(artist)
-    } for artist in artists]
-    artist_release = [{
-        'release_id': rid,
-        'artist_id': artist['artist_id'],
-        'artist_rank': idx
-    } for idx, artist in enumerate(artists)]
-    return (
-        pd.DataFrame(artist_release, index=range(n_artists)),
-        pd.DataFrame(artists, index=range(n_artists))
-    )
+    return _prepare_entity_data_json(data, 'artist', client, cache, report, fetch_missing)
+
 
+def prepare_label_data_json(data, client, cache=ENTITY_CACHE, report=None, fetch_missing=True):
+    """
+    prepare the label information and release-label links from raw release JSON
+    :param data: dict, /releases/{id} response
+    :param client: discogs_client.Client used on a cache miss
+    :param cache: EntityCache
+    :param report: see prepare_artist_data_json
+    :param fetch_missing: if False, leave images of uncached labels empty
+    :return: dataframe, dataframe
+    """
+    return _prepare_entity_data_json(data, 'label', client, cache, report, fetch_missing)
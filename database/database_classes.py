@@ -1,7 +1,19 @@
+from contextlib import nullcontext
+
+
 class BaseDB(object):
+    dialect = None  # sql dialect, for code that only runs on one backend
+
     def __init__(self, *args, **kwargs):
         pass
 
+    def transaction(self):
+        """
+        group several calls into one transaction where the database class supports it
+        usage: with db.transaction(): db.insert_rows(...); db.insert_rows(...)
+        """
+        return nullcontext()
+
     @staticmethod
     def _enquote_values(values, backtick=False, double_quote=False):
         if backtick is True:
@@ -57,6 +69,81 @@ class BaseDB(object):
             pass
         return data
 
+    def _where_clause(self, conditions, ranges=None, between=None, not_null=None, backtick=False):
+        """
+        build a parameterized WHERE clause
+        :param conditions: dict, column name -> list of accepted values (IN)
+        :param ranges: dict, column name -> (low, high), low <= column < high.
+            either bound may be None to leave that side open
+        :param between: dict, column name -> (low, high), column BETWEEN low AND high
+        :param not_null: list of column names that must not be NULL
+        :param backtick: quote column names with backticks (mysql) instead of double quotes
+        :return: (clause string, list of values) or ('', None) when there are no conditions
+        """
+        def q(colname):
+            return self._enquote_values([colname], backtick, not backtick)[0]
+        cond_values = []
+        format_st = []
+        for colname, values in conditions.items():
+            n = len(values)
+            if n == 0:
+                format_st.append('false')
+                continue
+            _ = ','.join(['%s'] * n)
+            format_st.append(f'{q(colname)} in ({_})')
+            cond_values.extend(values)
+        for colname, (low, high) in (ranges or {}).items():
+            if low is not None:
+                format_st.append(f'{q(colname)} >= %s')
+                cond_values.append(low)
+            if high is not None:
+                format_st.append(f'{q(colname)} < %s')
+                cond_values.append(high)
+        for colname, (low, high) in (between or {}).items():
+            format_st.append(f'{q(colname)} BETWEEN %s AND %s')
+            cond_values.extend([low, high])
+        for colname in (not_null or []):
+            format_st.append(f'{q(colname)} IS NOT NULL')
+        if len(format_st) == 0:
+            return '', None  # None is what cur.execute expects for no parameters
+        condition_string = ' AND '.join(format_st)
+        return f'WHERE {condition_string}', cond_values
+
+    def _select_query(self, source, columns=None, conditions=None, ranges=None,
+                      between=None, order_by=None, limit=None, backtick=False):
+        """
+        build a parameterized SELECT statement
+        :param source: qualified table or view name
+        :param columns: list of column names to return, None for all columns
+        :param conditions: see _where_clause
+        :param ranges: see _where_clause
+        :param between: see _where_clause
+        :param order_by: column name or list of column names,
+            prefix a name with '-' to sort descending
+        :param limit: maximum number of rows to return
+        :param backtick: quote column names with backticks (mysql) instead of double quotes
+        :return: (query string, list of values or None)
+        """
+        if isinstance(columns, str):
+            columns = [columns]
+        if isinstance(order_by, str):
+            order_by = [order_by]
+        select_list = '*' if not columns else self._comma_separate(
+            columns, backtick=backtick, double_quote=not backtick)
+        where, values = self._where_clause(
+            conditions or {}, ranges, between, backtick=backtick)
+        query = f'SELECT {select_list} FROM {source} \n{where}'
+        if order_by:
+            terms = [
+                f'{self._enquote_values([c.lstrip("-")], backtick, not backtick)[0]}'
+                f'{" DESC" if c.startswith("-") else ""}'
+                for c in order_by]
+            query += f'\nORDER BY {",".join(terms)}'
+        if limit is not None:
+            query += '\nLIMIT %s'
+            values = (values or []) + [int(limit)]
+        return self._validate(query), values
+
     def _prepare_col_names(self, df):
         labels = df.columns.tolist()
         return self._comma_separate(labels, double_quote=True)
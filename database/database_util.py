@@ -1,5 +1,169 @@
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import pandas as pd
 from sql.schema import *
 from database.data_extractors import *
+from result_cache import invalidate_frames
+
+
+def prepare_metadata_frames(release, report=None):
+    """
+    prepare the release, artist and label rows for a release
+    everything is read from the release JSON (one request at most); artist and
+    label images come from ENTITY_CACHE, so each artist and label is fetched once
+    :param release: discogs_client.Release object
+    :param report: list collecting (entity, id, field) for every request made
+    :return: dict, table name -> data frame
+    """
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        missing = audit_release(release)
+        if missing:
+            logging.debug(f'release {release.id}: {len(missing)} fields need a request: {missing}')
+    data = get_release_json(release, report)
+    release_info = prepare_release_data_json(data)
+    artist_release, artists = prepare_artist_data_json(data, release.client, report=report)
+    label_release, labels = prepare_label_data_json(data, release.client, report=report)
+    return {
+        RELEASE_TABLE: release_info,
+        E_ARTIST_RELEASE: artist_release,
+        ARTIST_TABLE: artists,
+        E_LABEL_RELEASE: label_release,
+        LABEL_TABLE: labels
+    }
+
+
+def prepare_release_frames(release, store_metadata):
+    """
+    prepare every row to be stored for a release; this is where API requests happen
+    :param release: discogs_client.Release object
+    :param store_metadata: if True, include release, artist, label data
+    :return: dict, table name -> data frame
+    """
+    frames = {MARKETPLACE_TABLE: prepare_price_data(release)}
+    if store_metadata:
+        frames.update(prepare_metadata_frames(release))
+    return frames
+
+
+def store_frames(db, frames):
+    """
+    write prepared rows to the database and refresh the daily price rollup
+    everything is written in one transaction, then memoized dashboard results
+    built from the releases, artists, labels and masters written are invalidated
+    :param db: database object (DBPostgreSQL or DBMySQL); the daily price rollup
+        is only kept in postgres
+    :param frames: dict, table name -> data frame, as from prepare_release_frames
+    :return: None
+    """
+    with db.transaction():
+        for tbl, df in frames.items():
+            db.insert_rows(df, tbl)
+        if MARKETPLACE_TABLE in frames and db.dialect == 'postgresql':
+            release_ids = frames[MARKETPLACE_TABLE]["release_id"].unique().tolist()
+            update_daily_prices(db, release_ids=release_ids, since=recent_days())
+    # once committed, drop the dashboard results showing old prices or missing new releases
+    invalidate_frames(frames.values())
+    return None
+
+
+class ReleaseBatch(object):
+    def __init__(self, db, batch_size=50, flush_seconds=30, on_flush=None):
+        """
+        unit of work: collect the rows for many releases and write them together
+        each flush writes every table with one bulk insert, all in one transaction
+        usage:
+            with ReleaseBatch(db) as batch:
+                batch.add_release(release, store_metadata=True)
+        :param db: database object (DBPostgreSQL or DBMySQL)
+        :param batch_size: flush after this many releases
+        :param flush_seconds: flush when the oldest pending release is this old
+        :param on_flush: function called with the list of keys passed to add
+            once their rows are committed
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.on_flush = on_flush
+        self._pending = defaultdict(list)
+        self._keys = []
+        self._n = 0
+        self._first_added = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        return False
+
+    def add(self, frames, key=None):
+        """
+        queue the rows for one release
+        :param frames: dict, table name -> data frame (from prepare_release_frames)
+        :param key: identifies the release to on_flush (e.g. the release id)
+        :return: None
+        """
+        for tbl, df in frames.items():
+            self._pending[tbl].append(df)
+        if key is not None:
+            self._keys.append(key)
+        self._n += 1
+        if self._first_added is None:
+            self._first_added = time.monotonic()
+        if self._n >= self.batch_size or self.age >= self.flush_seconds:
+            self.flush()
+        return None
+
+    def add_release(self, release, store_metadata=False, store_prices=True):
+        """
+        fetch and queue the rows for a release
+        :param release: discogs_client.Release object
+        :param store_metadata: if True, include release, artist, label data
+        :param store_prices: if True, include the marketplace stats
+        :return: None
+        """
+        if store_prices:
+            frames = prepare_release_frames(release, store_metadata)
+        else:
+            frames = prepare_metadata_frames(release)
+        self.add(frames, key=release.id)
+        return None
+
+    @property
+    def age(self):
+        if self._first_added is None:
+            return 0.
+        return time.monotonic() - self._first_added
+
+    def flush(self):
+        """
+        write all pending rows in one transaction, one bulk insert per table
+        if the write fails the pending rows are dropped (on_flush is not called for
+        them, so they are not marked stored) and the error is raised
+        :return: int, number of releases written
+        """
+        n = self._n
+        pending, keys = self._pending, self._keys
+        self._pending = defaultdict(list)
+        self._keys = []
+        self._n = 0
+        self._first_added = None
+        if n > 0:
+            frames = {
+                tbl: pd.concat(dfs, axis=0, ignore_index=True)
+                for tbl, dfs in pending.items()}
+            try:
+                store_frames(self.db, frames)
+            except Exception:
+                logging.error(f'failed to store {n} releases, dropped: {keys}')
+                raise
+            logging.info(f'stored {n} releases')
+            if self.on_flush is not None:
+                self.on_flush(keys)
+        return n
 
 
 def store_release_metadata(db, release):
@@ -10,17 +174,7 @@ def store_release_metadata(db, release):
     :return: None
     """
     print(f"Storing release metadata for: {release.title} by {release.artists[0].name}")
-
-    release_info = prepare_release_data(release)
-    db.insert_rows(release_info, RELEASE_TABLE)
-
-    artist_release, artists = prepare_artist_data(release)
-    db.insert_rows(artist_release, E_ARTIST_RELEASE)
-    db.insert_rows(artists, ARTIST_TABLE)
-
-    label_release, labels = prepare_label_data(release)
-    db.insert_rows(label_release, E_LABEL_RELEASE)
-    db.insert_rows(labels, LABEL_TABLE)
+    store_frames(db, prepare_metadata_frames(release))
     return None
 
 
@@ -29,16 +183,56 @@ def store_release_data(db, release, store_metadata):
     store the marketplace stats and release info for a release
     :param release: Release object
     :param store_metadata: if True, store release, artist, label data
-    :param store_prices: if True, store prices in marketplace table
     :param db: str, which database to use (mysql or postgres)
     :return: None
     """
     assert isinstance(release, discogs_client.Release), f"release is {type(release)}"
     print(f"Storing marketplace data for: {release.title} by {release.artists[0].name}")
-    marketplace_data = prepare_price_data(release)
-    db.insert_rows(marketplace_data, MARKETPLACE_TABLE)
-    if store_metadata:
-        store_release_metadata(db, release)
+    store_frames(db, prepare_release_frames(release, store_metadata))
+    return None
+
+
+def recent_days(n=1):
+    """
+    start of the UTC day n days ago
+    the current and previous day are refreshed together so a sample stored
+    just after midnight still lands in the right bucket
+    :param n: number of whole days before today
+    :return: datetime
+    """
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=n)
+
+
+def update_daily_prices(db, release_ids=None, since=None):
+    """
+    recompute buckets of the daily price rollup from the raw marketplace rows
+    called with one release id after each new price, and with no arguments to backfill
+    :param db: DBPostgreSQL object
+    :param release_ids: list of release ids to refresh, None for all releases
+    :param since: datetime, only refresh days starting at or after this time
+    :return: None
+    """
+    if db.dialect != 'postgresql':
+        raise NotImplementedError(f'the daily price rollup needs postgres, not {db.dialect}')
+    where, values = db._where_clause(
+        {} if release_ids is None else {'release_id': release_ids},
+        ranges=None if since is None else {'when': (since, None)},
+        not_null=['when', 'lowest_price'])
+    query = (
+        f'INSERT INTO {SCHEMA_NAME}.{MARKETPLACE_DAILY_TABLE}'
+        f'(release_id, day, lowest_price, num_for_sale, n_samples)\n'
+        f'SELECT release_id, ("when" AT TIME ZONE \'UTC\')::date AS day,\n'
+        f'    min(lowest_price), max(num_for_sale), count(*)\n'
+        f'FROM {SCHEMA_NAME}.{MARKETPLACE_TABLE}\n'
+        f'{where}\n'
+        f'GROUP BY 1, 2\n'
+        f'ON CONFLICT (release_id, day) DO UPDATE SET\n'
+        f'    lowest_price = EXCLUDED.lowest_price,\n'
+        f'    num_for_sale = EXCLUDED.num_for_sale,\n'
+        f'    n_samples = EXCLUDED.n_samples;')
+    db._query(query, values)
+    return None
 
 
 # -----------------------------------------------------------------------------
@@ -59,6 +253,72 @@ def get_price_data(db, **conditions):
     return df
 
 
+def get_daily_price_data(db, **conditions):
+    """
+    get marketplace data bucketed by day from the rollup for releases matching certain conditions
+    :param db: DBPostgreSQL object
+    :return: pandas data frame with the columns of get_price_data, one row per release and day
+    """
+    df = db.read_rows(PRICES_DAILY_VIEW, **conditions)
+    df = df.sort_values(["release_id", "when"])
+    df["country"] = df["country"].fillna("-")
+    df["lowest_price"] = df["lowest_price"].astype(float)
+    return df
+
+
+def get_price_summary(db, groupings, x_measure, y_measure, **conditions):
+    """
+    summarize marketplace data by groups inside the database
+    :param db: DBPostgreSQL object
+    :param groupings: names of the grouping columns
+    :param x_measure: aggregate applied to num_for_sale (median, mean, min, max)
+    :param y_measure: aggregate applied to lowest_price (median, mean, min, max)
+    :return: data frame indexed by groupings with columns lowest_price, num_for_sale, count
+    """
+    df = db.aggregate_rows(
+        PRICES_VIEW, groupings,
+        measures={
+            'lowest_price': (y_measure, 'lowest_price'),
+            'num_for_sale': (x_measure, 'num_for_sale'),
+            'count': ('nunique', 'title')
+        }, **conditions)
+    if "country" in groupings:
+        df["country"] = df["country"].fillna("-")
+    df["lowest_price"] = df["lowest_price"].astype(float)
+    df["num_for_sale"] = df["num_for_sale"].astype(float)
+    return df.set_index(groupings).sort_index()
+
+
+def get_refresh_stats(db, since):
+    """
+    per-release inputs for ranking which releases to refresh next
+    :param db: DBPostgreSQL object
+    :param since: datetime, start of the window to measure
+    :return: data frame with release_id, last_sampled (time of the newest sample),
+        volatility (coefficient of variation of the daily lowest price)
+        and num_for_sale (average number for sale)
+    """
+    query = (
+        f'SELECT release_id, m.last_sampled, d.volatility, d.num_for_sale\n'
+        f'FROM (\n'
+        f'    SELECT release_id,\n'
+        f'        coalesce(stddev_samp(lowest_price) / nullif(avg(lowest_price), 0), 0) AS volatility,\n'
+        f'        avg(num_for_sale) AS num_for_sale\n'
+        f'    FROM {SCHEMA_NAME}.{MARKETPLACE_DAILY_TABLE}\n'
+        f'    WHERE day >= %s::date\n'
+        f'    GROUP BY release_id) d\n'
+        f'FULL JOIN (\n'
+        f'    SELECT release_id, max("when") AS last_sampled\n'
+        f'    FROM {SCHEMA_NAME}.{MARKETPLACE_TABLE}\n'
+        f'    WHERE "when" >= %s\n'
+        f'    GROUP BY release_id) m USING (release_id);')
+    rows = db._query(query, (since, since))
+    df = pd.DataFrame(rows, columns=['release_id', 'last_sampled', 'volatility', 'num_for_sale'])
+    df["volatility"] = df["volatility"].astype(float).fillna(0)
+    df["num_for_sale"] = df["num_for_sale"].astype(float).fillna(0)
+    return df
+
+
 def get_metadata(db, entity, **conditions):
     if entity == "label":
         output = db.read_rows(LABEL_TABLE, **conditions)
@@ -1,9 +1,12 @@
 from database.database_classes import BaseDB
+from database.instrumentation import MeteredMySQLCursor
 import mysql.connector
 import pandas as pd
 
 
 class DBMySQL(BaseDB):
+    dialect = 'mysql'
+
     def __init__(self, cred, *args, **kwargs):
         """
         Create a MySQL database interface object
@@ -49,27 +52,50 @@ class DBMySQL(BaseDB):
         values = tuple(values)
         return self._execute(query, values, commit=True)
 
-    def read_rows(self, table, **conditions):
-        query = f'select * from {self.database}.{table} '
-        cond_values = None  # this name needs to be defined for cur.execute to run
-        if len(conditions) > 0:
-            cond_values = []
-            format_st = []
-            for colname, values in conditions.items():
-                n = len(values)
-                _ = ','.join(['%s'] * n)
-                fmt = f'{colname} in ({_})'
-                format_st.append(fmt)
-                cond_values.extend(values)
-            condition_string = ' AND '.join(format_st)
-            query += f'WHERE {condition_string}'
+    def read_rows(self, table, chunksize=None, columns=None, ranges=None,
+                  between=None, order_by=None, limit=None, **conditions):
+        """
+        read data from the table where conditions are true
+        :param table: str, name of the table
+        :param chunksize: if given, stream the result with an unbuffered cursor
+            and return an iterator of data frames with at most chunksize rows each
+        :param columns: list of column names to select, None for all columns
+        :param ranges: dict, column name -> (low, high) for low <= column < high
+        :param between: dict, column name -> (low, high) for column BETWEEN low AND high
+        :param order_by: column name or list of them, '-' prefix for descending
+        :param limit: maximum number of rows to return
+        :param conditions: keyword arguments of the form <column_name> = <values>
+        :return: pandas data frame, or iterator of data frames if chunksize is given
+        """
+        query, cond_values = self._select_query(
+            f'{self.database}.{table}', columns=columns, conditions=conditions,
+            ranges=ranges, between=between, order_by=order_by, limit=limit,
+            backtick=True)
+        if chunksize is not None:
+            return self._read_chunks(query, cond_values, chunksize)
         output = self._execute(query, cond_values)
         return output
 
+    def _read_chunks(self, query, values, chunksize):
+        """
+        generator of data frames, rows are pulled from the server as they are consumed
+        """
+        query = self._validate(query)
+        # consume_results lets the connection close cleanly if the caller stops early
+        with mysql.connector.connect(**self.credentials, consume_results=True) as con:
+            cur = MeteredMySQLCursor(con.cursor(buffered=False))
+            cur.execute(query, values)
+            columns = [_[0] for _ in cur.description]
+            while True:
+                rows = cur.fetchmany(chunksize)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=columns)
+
     def _execute(self, query, values, commit=False):
         query = self._validate(query)
         with mysql.connector.connect(**self.credentials) as con:
-            cur = con.cursor()
+            cur = MeteredMySQLCursor(con.cursor())
             cur.execute(query, values)
             if commit is True:
                 con.commit()
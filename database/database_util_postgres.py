@@ -1,9 +1,16 @@
+import threading
+from contextlib import contextmanager, nullcontext
 import numpy as np
 import psycopg2
 from psycopg2.extensions import register_adapter, AsIs
+from psycopg2.extras import execute_values
+from io import StringIO
+from uuid import uuid4
 import pandas as pd
 from sql.schema import SCHEMA_NAME
 from database.database_classes import BaseDB
+from database.connection_pool import get_pool
+from database.slow_query import SlowQueryLog
 
 
 def adapt_numpy_float64(numpy_float64):
@@ -18,18 +25,53 @@ register_adapter(np.float64, adapt_numpy_float64)
 register_adapter(np.int64, adapt_numpy_int64)
 
 
+BULK_PAGE_SIZE = 1000  # rows per multi-row VALUES statement
+BULK_COPY_MIN_ROWS = 5000  # frames at least this long are loaded with COPY
+COPY_NULL = '\\N'  # marker for NULL in COPY csv data
+
+# aggregate functions available to aggregate_rows, by pandas-style name
+AGGREGATES = {
+    'median': 'percentile_cont(0.5) WITHIN GROUP (ORDER BY {col})',
+    'mean': 'avg({col})',
+    'min': 'min({col})',
+    'max': 'max({col})',
+    'sum': 'sum({col})',
+    'count': 'count({col})',
+    'nunique': 'count(DISTINCT {col})'
+}
+
+
 # -----------------------------------------------------------------------------
 # - General database functions ------------------------------------------------
 # -----------------------------------------------------------------------------
 
 class DBPostgreSQL(BaseDB):
-    def __init__(self, cred, *args, **kwargs):
+    dialect = 'postgresql'
+
+    def __init__(self, cred, *args, pool_options=None, slow_query=None, **kwargs):
+        """
+        Create a PostgreSQL database interface object
+        :param cred: dict, credentials for database
+        :param pool_options: dict, keyword arguments for ConnectionPool
+            (minconn, maxconn, idle_timeout, health_check, checkout_timeout).
+            falls back to the 'pool' entry of cred when not given.
+        :param slow_query: dict, keyword arguments for SlowQueryLog (threshold, path,
+            explain, max_bytes, backup_count) to log slow statements made through
+            this object; falls back to the 'slow_query' entry of cred. off when neither is set.
+        """
         BaseDB.__init__(self, cred, *args, **kwargs)
         self.user = cred.get('user')
         self.host = cred.get('host')
         self.port = cred.get('port')
         self.dbname = cred.get('dbname')
         self.password = cred.get('password')
+        if pool_options is None:
+            pool_options = cred.get('pool') or {}
+        self.pool_options = pool_options
+        if slow_query is None:
+            slow_query = cred.get('slow_query')
+        self.slow_query_log = SlowQueryLog(**slow_query) if slow_query is not None else None
+        self._local = threading.local()
 
     @property
     def credentials(self):
@@ -41,93 +83,303 @@ class DBPostgreSQL(BaseDB):
             'password': self.password
         }
 
-    def _query(self, q):
+    @property
+    def pool(self):
+        """
+        connection pool shared by every DBPostgreSQL object with these credentials
+        the pool is created on first use so constructing this object does no i/o
+        """
+        return get_pool(self.credentials, **self.pool_options)
+
+    def _connection(self):
+        """
+        borrow a pooled connection; commits on success and rolls back on error
+        inside transaction() the thread's open connection is reused instead
+        usage: with self._connection() as conn: ...
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return nullcontext(conn)
+        return self._checkout()
+
+    @contextmanager
+    def _checkout(self):
+        """
+        borrow a pooled connection for one transaction, set up for this object
+        """
+        with self.pool.connection() as conn:
+            conn.slow_query_log = self.slow_query_log
+            try:
+                yield conn
+            finally:
+                conn.slow_query_log = None
+
+    @contextmanager
+    def transaction(self):
+        """
+        run every call made by this thread inside the block in one transaction
+        commits when the block exits normally and rolls back on error;
+        a nested transaction() joins the outer one
+        usage: with db.transaction(): db.insert_rows(...); db.update_rows(...)
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        with self._checkout() as conn:
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+
+    def _query(self, q, values=None):
         """
         DANGER!
         execute any query, no validation is performed
+        :param q: query string, may contain %s placeholders
+        :param values: sequence of values for the placeholders
+        :return: list of result rows, or None if the statement returns no rows
         """
-        with psycopg2.connect(**self.credentials) as conn:
+        with self._connection() as conn:
             cur = conn.cursor()
-            cur.execute(q)
+            cur.execute(q, values)
+            if cur.description is None:
+                return None
             return cur.fetchall()
         
 
-    def insert_rows(self, df, tbl, schema=None, returning=None):
+    def insert_rows(self, df, tbl, schema=None, returning=None, method=None):
         """
         Write rows of dataframe 'df' to the database table 'tbl'
+        rows that violate a unique constraint are skipped (ON CONFLICT DO NOTHING)
         :param df: pandas data frame
         :param tbl: table name
-        :param returning:
-        :return: None
+        :param returning: str or list of str, columns of the inserted rows to return
+        :param method: 'values' for batched multi-row VALUES statements,
+            'copy' to COPY into a staging table and merge from there,
+            None to choose by the number of rows in df
+        :return: data frame of returned columns if returning is not None, else None
         """
         if schema is None:
             schema = SCHEMA_NAME
-        col_names = self._prepare_col_names(df)
-        n_col = df.shape[1]
-        fmt = ','.join(['%s'] * n_col)
-        with psycopg2.connect(**self.credentials) as conn:
+        if method is None:
+            method = 'copy' if df.shape[0] >= BULK_COPY_MIN_ROWS else 'values'
+        if df.shape[0] == 0:
+            return None
+        if returning is not None and not isinstance(returning, str):
+            returning = self._comma_separate(returning)
+        if method == 'copy':
+            insert = self._insert_copy
+        elif method == 'values':
+            insert = self._insert_values
+        else:
+            raise ValueError(f'unknown insert method: {method}')
+        with self._connection() as conn:
             cur = conn.cursor()
-            for idx, row in df.iterrows():
-                query = f"INSERT INTO {schema}.{tbl}({col_names})\nVALUES ({fmt})\n"
-                query += f'RETURNING {returning}' if returning is not None else ''
-                query += f"ON CONFLICT DO NOTHING"
-                query = self._validate(query)
-                try:
-                    cur.execute(query, row.values)
-                except psycopg2.ProgrammingError as e:
-                    print({'query': query})
-                    print({'values': row})
-                    raise e
+            output = insert(cur, df, tbl, schema, returning)
+            if returning is not None:
+                return pd.DataFrame(
+                    output,
+                    columns=[col[0] for col in cur.description])
+        return None
+
+    def _insert_values(self, cur, df, tbl, schema, returning):
+        """
+        insert df with multi-row VALUES statements of BULK_PAGE_SIZE rows each
+        :return: list of returned rows if returning is not None
+        """
+        col_names = self._prepare_col_names(df)
+        query = f"INSERT INTO {schema}.{tbl}({col_names})\nVALUES %s\nON CONFLICT DO NOTHING"
+        query += f'\nRETURNING {returning}' if returning is not None else ''
+        rows = list(self._null_safe(df).itertuples(index=False, name=None))
+        try:
+            output = execute_values(
+                cur, query, rows, page_size=BULK_PAGE_SIZE,
+                fetch=returning is not None)
+        except psycopg2.ProgrammingError as e:
+            print({'query': query})
+            raise e
+        return output
+
+    def _insert_copy(self, cur, df, tbl, schema, returning):
+        """
+        stream df into a temporary staging table with COPY, then merge the
+        staging table into the target table in a single statement
+        :return: list of returned rows if returning is not None
+        """
+        col_names = self._prepare_col_names(df)
+        stage = f'_stage_{tbl}'
+        cur.execute(f'DROP TABLE IF EXISTS {stage};')
+        cur.execute(
+            f'CREATE TEMP TABLE {stage} ON COMMIT DROP AS\n'
+            f'SELECT {col_names} FROM {schema}.{tbl} WITH NO DATA;')
+        buf = StringIO()
+        self._integral_floats(df).to_csv(buf, index=False, header=False, na_rep=COPY_NULL)
+        buf.seek(0)
+        cur.copy_expert(
+            f"COPY {stage}({col_names}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buf)
+        query = (
+            f'INSERT INTO {schema}.{tbl}({col_names})\n'
+            f'SELECT {col_names} FROM {stage}\n'
+            f'ON CONFLICT DO NOTHING')
+        query += f'\nRETURNING {returning}' if returning is not None else ''
+        cur.execute(self._validate(query))
+        if returning is not None:
+            return cur.fetchall()
         return None
 
-    def update_rows(self, df, index_col, tbl, schema=None):
+    @staticmethod
+    def _null_safe(df):
+        """
+        convert missing values (NaN, NaT, pd.NA) to None so they are written as NULL
+        """
+        return df.astype(object).where(df.notna(), None)
+
+    @staticmethod
+    def _integral_floats(df):
+        """
+        cast float columns holding only whole numbers (integer columns that picked
+        up a NaN) back to a nullable integer type so COPY writes 7, not 7.0
+        """
+        output = df.copy()
+        for col in output.columns:
+            values = output[col]
+            if values.dtype.kind == 'f' and (values.dropna() % 1 == 0).all():
+                output[col] = values.astype('Int64')
+        return output
+
+    def update_rows(self, df, index_col, tbl, schema=None, chunk_size=BULK_PAGE_SIZE):
         """
         update values in rows
+        each chunk of rows is sent as one UPDATE ... FROM (VALUES ...) statement
+        joined on index_col; rows whose values already match are left alone
         :param df: data frame of values to update
         :param index_col: name of the primary key column to use in the where statement
         :param tbl: table name
-        :return: None
+        :param chunk_size: number of rows per UPDATE statement
+        :return: int, number of rows changed
         """
         if schema is None:
             schema = SCHEMA_NAME
-        df = df.set_index(index_col)
-        with psycopg2.connect(**self.credentials) as conn:
+        if df.shape[0] == 0:
+            return 0
+        col_names = [c for c in df.columns.to_list() if c != index_col]
+        all_cols = [index_col] + col_names
+        df = self._null_safe(df[all_cols])
+        rows = list(df.itertuples(index=False, name=None))
+        n_updated = 0
+        with self._connection() as conn:
             cur = conn.cursor()
-            col_names = df.columns.to_list()
-            for idx, row in df.iterrows():
-                values = row.values
-                update_string = ','.join([f'{col_name} = %s' for col_name in col_names])
-                query = f'update {schema}.{tbl} set {update_string} where {index_col} = {idx}'
-                cur.execute(query, values)
-        return None
+            col_types = self._column_types(cur, tbl, schema)
+            template = ','.join([f'%s::{col_types[c]}' for c in all_cols])
+            set_string = ','.join([f'"{c}" = v."{c}"' for c in col_names])
+            t_cols = self._comma_separate([f't."{c}"' for c in col_names])
+            v_cols = self._comma_separate([f'v."{c}"' for c in col_names])
+            query = (
+                f'UPDATE {schema}.{tbl} AS t SET {set_string}\n'
+                f'FROM (VALUES %s) AS v({self._comma_separate(all_cols, double_quote=True)})\n'
+                f'WHERE t."{index_col}" = v."{index_col}"\n'
+                f'AND ({t_cols}) IS DISTINCT FROM ({v_cols})')
+            for i in range(0, len(rows), chunk_size):
+                chunk = rows[i:i + chunk_size]
+                execute_values(cur, query, chunk, template=f'({template})', page_size=len(chunk))
+                n_updated += cur.rowcount
+        return n_updated
 
-    def read_rows(self, tbl, schema=None, **conditions):
+    @staticmethod
+    def _column_types(cur, tbl, schema):
+        """
+        look up the declared type of each column of a table
+        :return: dict, column name -> type name usable in a cast
+        """
+        cur.execute(
+            'SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute '
+            'WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped;',
+            (f'{schema}.{tbl}',))
+        return dict(cur.fetchall())
+
+    def read_rows(self, tbl, schema=None, chunksize=None, columns=None, ranges=None,
+                  between=None, order_by=None, limit=None, **conditions):
         """
         read data from the database table tbl where conditions are true
         :param tbl: name of the database table
+        :param chunksize: if given, stream the result through a server-side cursor
+            and return an iterator of data frames with at most chunksize rows each
+        :param columns: list of column names to select, None for all columns
+        :param ranges: dict, column name -> (low, high) for low <= column < high,
+            e.g. ranges={'when': (start, None)}
+        :param between: dict, column name -> (low, high) for column BETWEEN low AND high
+        :param order_by: column name or list of them, '-' prefix for descending
+        :param limit: maximum number of rows to return
         :param conditions: keyword arguments of the form <column_name> = <value>
-        :return: pandas data frame
+        :return: pandas data frame, or iterator of data frames if chunksize is given
         """
         if schema is None:
             schema = SCHEMA_NAME
-        query = f"SELECT * FROM {schema}.{tbl} \n"
-        cond_values = None  # this name needs to be defined for cur.execute to run
-        if len(conditions) > 0:
-            cond_values = []
-            format_st = []
-            for colname, values in conditions.items():
-                n = len(values)
-                _ = ','.join(['%s'] * n)
-                fmt = f'{colname} in ({_})'
-                format_st.append(fmt)
-                cond_values.extend(values)
-            condition_string = ' AND '.join(format_st)
-            query += f'WHERE {condition_string}'
+        query, cond_values = self._select_query(
+            f'{schema}.{tbl}', columns=columns, conditions=conditions, ranges=ranges,
+            between=between, order_by=order_by, limit=limit)
+        if chunksize is not None:
+            return self._read_chunks(query, cond_values, chunksize)
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, cond_values)
+            output = pd.DataFrame(
+                cur.fetchall(),
+                columns=[col[0] for col in cur.description])
+        return output
+
+    def aggregate_rows(self, tbl, groupings, measures, schema=None, ranges=None,
+                       between=None, **conditions):
+        """
+        summarize the rows of tbl in the database with GROUP BY, one row per group
+        :param tbl: name of the database table or view
+        :param groupings: list of column names to group by
+        :param measures: dict, output column name -> (aggregate, input column)
+            where aggregate is a key of AGGREGATES, e.g. {'price': ('median', 'lowest_price')}
+        :param ranges: see read_rows
+        :param between: see read_rows
+        :param conditions: keyword arguments of the form <column_name> = <values>
+        :return: pandas data frame with the grouping columns and one column per measure
+        """
+        if schema is None:
+            schema = SCHEMA_NAME
+        group_list = self._comma_separate(groupings, double_quote=True)
+        agg_list = []
+        for name, (agg, col) in measures.items():
+            if agg not in AGGREGATES:
+                raise ValueError(f'unknown aggregate: {agg}')
+            expr = AGGREGATES[agg].format(col=f'"{col}"')
+            agg_list.append(f'{expr} AS "{name}"')
+        where, cond_values = self._where_clause(conditions, ranges, between)
+        query = (
+            f'SELECT {group_list}, {",".join(agg_list)}\n'
+            f'FROM {schema}.{tbl}\n{where}\n'
+            f'GROUP BY {group_list}')
         query = self._validate(query)
-        with psycopg2.connect(**self.credentials) as conn:
+        with self._connection() as conn:
             cur = conn.cursor()
             cur.execute(query, cond_values)
             output = pd.DataFrame(
                 cur.fetchall(),
                 columns=[col[0] for col in cur.description])
         return output
+
+    def _read_chunks(self, query, values, chunksize):
+        """
+        generator of data frames read through a named (server-side) cursor
+        the pooled connection is held until the generator is exhausted or closed
+        """
+        with self._connection() as conn:
+            with conn.cursor(name=f'read_rows_{uuid4().hex}') as cur:
+                cur.itersize = chunksize
+                cur.execute(query, values)
+                while True:
+                    rows = cur.fetchmany(chunksize)
+                    if not rows:
+                        break
+                    yield pd.DataFrame(
+                        rows,
+                        columns=[col[0] for col in cur.description])
@@ -0,0 +1,155 @@
+import re
+import time
+from psycopg2.extensions import cursor as _cursor, connection as _connection
+from metrics import METRICS
+
+
+# first table or view named by a statement, used to label its metrics
+RELATION_PATTERN = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|JOIN|TABLE)\s+((?:[`"]?\w+[`"]?\.)?[`"]?\w+[`"]?)', re.IGNORECASE)
+BYTES_SAMPLE_ROWS = 50  # rows sampled to estimate the size of a result
+
+
+def query_labels(db, query):
+    """
+    metric labels for a statement: database, statement keyword and relation
+    :param db: 'postgres' or 'mysql'
+    :param query: str or bytes
+    :return: dict
+    """
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    query = query.lstrip()
+    statement = query.split(None, 1)[0].upper() if query else ''
+    match = RELATION_PATTERN.search(query)
+    relation = match.group(1).replace('"', '').replace('`', '') if match else ''
+    return {'db': db, 'statement': statement, 'relation': relation}
+
+
+def estimate_bytes(rows):
+    """
+    approximate size of result rows from the text length of a sample of them
+    :param rows: list of tuples
+    :return: int
+    """
+    if not rows:
+        return 0
+    step = max(1, len(rows) // BYTES_SAMPLE_ROWS)
+    sample = rows[::step]
+    size = sum(len(str(value)) for row in sample for value in row)
+    return int(size * len(rows) / len(sample))
+
+
+def record_query(labels, seconds, bytes_sent=0, rows_affected=None):
+    METRICS.observe('db_query_seconds', seconds, **labels)
+    METRICS.inc('db_bytes_sent_total', bytes_sent, db=labels['db'], relation=labels['relation'])
+    if rows_affected is not None and rows_affected > 0:
+        METRICS.inc('db_rows_total', rows_affected, **labels)
+    return None
+
+
+def record_fetch(labels, seconds, rows):
+    METRICS.observe('db_fetch_seconds', seconds, **labels)
+    METRICS.inc('db_rows_total', len(rows), **labels)
+    METRICS.inc(
+        'db_bytes_received_total', estimate_bytes(rows),
+        db=labels['db'], relation=labels['relation'])
+    return None
+
+
+class MeteredConnection(_connection):
+    """
+    psycopg2 connection that can carry a SlowQueryLog for its cursors
+    installed as the connection_factory of pooled connections
+    """
+    slow_query_log = None
+
+
+class MeteredCursor(_cursor):
+    """
+    psycopg2 cursor recording statement latency, rows and bytes in METRICS
+    and passing statements to the connection's slow query log, if any
+    installed as the cursor_factory of pooled connections
+    """
+    _labels = {'db': 'postgres', 'statement': '', 'relation': ''}
+
+    def execute(self, query, vars=None):
+        self._labels = query_labels('postgres', query)
+        t1 = time.perf_counter()
+        try:
+            output = super().execute(query, vars)
+        finally:
+            seconds = time.perf_counter() - t1
+            record_query(
+                self._labels, seconds, len(self.query or b''),
+                self.rowcount if self.description is None else None)
+        slow_query_log = getattr(self.connection, 'slow_query_log', None)
+        # a named cursor only declares here; its time is spent in the fetches
+        if slow_query_log is not None and self.name is None:
+            slow_query_log.record(
+                self.connection, query, vars, seconds, self._labels['relation'])
+        return output
+
+    def copy_expert(self, sql, file, size=8192):
+        self._labels = query_labels('postgres', sql)
+        start = file.tell() if hasattr(file, 'tell') else 0
+        t1 = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            sent = file.tell() - start if hasattr(file, 'tell') else 0
+            record_query(self._labels, time.perf_counter() - t1, sent, self.rowcount)
+
+    def fetchall(self):
+        t1 = time.perf_counter()
+        rows = super().fetchall()
+        record_fetch(self._labels, time.perf_counter() - t1, rows)
+        return rows
+
+    def fetchmany(self, size=None):
+        t1 = time.perf_counter()
+        rows = super().fetchmany() if size is None else super().fetchmany(size)
+        record_fetch(self._labels, time.perf_counter() - t1, rows)
+        return rows
+
+    def fetchone(self):
+        t1 = time.perf_counter()
+        row = super().fetchone()
+        record_fetch(self._labels, time.perf_counter() - t1, [] if row is None else [row])
+        return row
+
+
+class MeteredMySQLCursor(object):
+    def __init__(self, cursor):
+        """
+        wrap a mysql.connector cursor to record statement latency, rows and bytes
+        :param cursor: mysql.connector cursor
+        """
+        self._cursor = cursor
+        self._labels = {'db': 'mysql', 'statement': '', 'relation': ''}
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._labels = query_labels('mysql', operation)
+        t1 = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            statement = getattr(self._cursor, 'statement', None) or operation
+            record_query(
+                self._labels, time.perf_counter() - t1, len(statement),
+                self._cursor.rowcount if self._cursor.description is None else None)
+
+    def fetchall(self):
+        t1 = time.perf_counter()
+        rows = self._cursor.fetchall()
+        record_fetch(self._labels, time.perf_counter() - t1, rows)
+        return rows
+
+    def fetchmany(self, size=1):
+        t1 = time.perf_counter()
+        rows = self._cursor.fetchmany(size)
+        record_fetch(self._labels, time.perf_counter() - t1, rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
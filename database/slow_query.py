@@ -0,0 +1,100 @@
+import os
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+from datetime import datetime, timezone
+import psycopg2
+from psycopg2.extensions import cursor as plain_cursor
+from metrics import METRICS
+
+
+SLOW_QUERY_FILE = 'cache/slow_queries.log'
+SLOW_QUERY_THRESHOLD = .5  # seconds
+SLOW_QUERY_MAX_BYTES = 10 * 2 ** 20  # size of a log file before it is rotated
+SLOW_QUERY_BACKUPS = 5  # rotated log files kept
+# statements that are safe to run a second time under EXPLAIN ANALYZE
+READ_STATEMENTS = ('SELECT', 'WITH', 'TABLE', 'VALUES')
+
+
+class SlowQueryLog(object):
+    def __init__(self, threshold=SLOW_QUERY_THRESHOLD, path=SLOW_QUERY_FILE, explain=True,
+                 max_bytes=SLOW_QUERY_MAX_BYTES, backup_count=SLOW_QUERY_BACKUPS):
+        """
+        record statements slower than a threshold, with their plan, in a rotating log
+        each entry is one json line: when, seconds, relation, query, params, plan.
+        reads are planned with EXPLAIN (ANALYZE, BUFFERS), which runs them again;
+        writes only get EXPLAIN so they are never applied twice
+        :param threshold: seconds
+        :param path: log file name
+        :param explain: if False, log the statement without a plan
+        :param max_bytes: size at which the log file is rotated
+        :param backup_count: number of rotated files kept
+        """
+        self.threshold = threshold
+        self.path = path
+        self.explain = explain
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._logger = logging.getLogger(f'slow_query.{os.path.abspath(path)}')
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if not self._logger.handlers:
+            self._logger.addHandler(
+                RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count))
+
+    def plan(self, conn, query, params):
+        """
+        plan a statement on the connection that ran it, inside a savepoint
+        :return: str, the query plan or the reason it could not be made
+        """
+        analyze = query.lstrip().split(None, 1)[0].upper() in READ_STATEMENTS
+        explain = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+        # a plain cursor, so the EXPLAIN is neither metered nor logged itself
+        with conn.cursor(cursor_factory=plain_cursor) as cur:
+            cur.execute('SAVEPOINT slow_query_explain')
+            try:
+                cur.execute(explain + query, params)
+                output = '\n'.join(row[0] for row in cur.fetchall())
+            except psycopg2.Error as e:
+                output = f'EXPLAIN failed: {e}'.strip()
+            cur.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            cur.execute('RELEASE SAVEPOINT slow_query_explain')
+        return output
+
+    def record(self, conn, query, params, seconds, relation=''):
+        """
+        log a statement if it took at least threshold seconds
+        :param conn: connection the statement ran on
+        :param query: str or bytes, the statement
+        :param params: its parameters
+        :param seconds: execution time
+        :param relation: table or view the statement reads or writes
+        :return: None
+        """
+        if seconds < self.threshold:
+            return None
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        METRICS.inc('db_slow_queries_total', db='postgres', relation=relation)
+        entry = {
+            'when': datetime.now(timezone.utc).isoformat(),
+            'seconds': round(seconds, 6),
+            'relation': relation,
+            'query': query,
+            'params': params,
+            'plan': self.plan(conn, query, params) if self.explain else None
+        }
+        self._logger.info(json.dumps(entry, default=str))
+        return None
+
+
+def read_slow_queries(path=SLOW_QUERY_FILE):
+    """
+    :param path: log file name
+    :return: list of dict, the entries of the current log file, oldest first
+    """
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
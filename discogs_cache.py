@@ -0,0 +1,241 @@
+import os
+import re
+import time
+import logging
+import threading
+from sqlite_store import SqliteStore
+
+
+# point the clients at a local stand-in (python -m mock_discogs.server), e.g.
+# DISCOGS_API_URL=http://127.0.0.1:5050; no OAuth keys are needed then
+DISCOGS_API_URL = os.environ.get('DISCOGS_API_URL')
+RESPONSE_CACHE_FILE = 'cache/discogs_responses.sqlite'
+METADATA_TTL = 7 * 24 * 3600  # seconds a release, artist, label or master response is served locally
+MARKETPLACE_TTL = 3600  # seconds a marketplace stats response is served locally
+RESPONSE_CACHE_MAX_ENTRIES = 50000
+
+# API paths that are cached: (regular expression, entity, kind of ttl)
+CACHED_PATHS = [
+    (re.compile(r'/releases/(\d+)$'), 'release', 'metadata'),
+    (re.compile(r'/artists/(\d+)$'), 'artist', 'metadata'),
+    (re.compile(r'/labels/(\d+)$'), 'label', 'metadata'),
+    (re.compile(r'/masters/(\d+)$'), 'master', 'metadata'),
+    (re.compile(r'/marketplace/stats/(\d+)$'), 'marketplace_stats', 'marketplace'),
+]
+
+
+def api_scoped_path(path, api_url=None):
+    """
+    file name for state that depends on which discogs API was used, so a run
+    against DISCOGS_API_URL never leaves data a live run would trust
+    e.g. cache/discogs_listings.json -> cache/discogs_listings_127.0.0.1_5050.json
+    :param path: file name used with the live API
+    :param api_url: API url, defaults to DISCOGS_API_URL; None for the live API
+    :return: str
+    """
+    if api_url is None:
+        api_url = DISCOGS_API_URL
+    if not api_url:
+        return path
+    slug = re.sub(r'[^\w.]+', '_', re.sub(r'^\w+://', '', api_url)).strip('_')
+    root, ext = os.path.splitext(path)
+    return f'{root}_{slug}{ext}'
+
+
+def parse_entity_url(url):
+    """
+    :param url: API url
+    :return: (entity, id, kind of ttl), or None if responses from the url are not cached
+    """
+    path = url.split('?')[0]
+    for pattern, entity, kind in CACHED_PATHS:
+        match = pattern.search(path)
+        if match:
+            return entity, int(match.group(1)), kind
+    return None
+
+
+class ResponseCache(SqliteStore):
+    def __init__(self, path=RESPONSE_CACHE_FILE, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        """
+        on-disk store of discogs API responses keyed by entity type and id
+        entries carry the ETag and Last-Modified headers so stale entries can be
+        revalidated; the least recently used entries are evicted beyond max_entries
+        :param path: sqlite file name
+        :param max_entries: number of responses kept
+        """
+        super().__init__(path, schema=(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'entity TEXT NOT NULL, entity_id INTEGER NOT NULL, url TEXT NOT NULL, '
+            'body BLOB NOT NULL, etag TEXT, last_modified TEXT, '
+            'fetched_at REAL NOT NULL, accessed_at REAL NOT NULL, '
+            'PRIMARY KEY (entity, entity_id))',
+            'CREATE INDEX IF NOT EXISTS responses_accessed_idx ON responses (accessed_at)'
+        ))
+        self.max_entries = max_entries
+
+    def get(self, entity, id_val):
+        """
+        :param entity: entity type (release, artist, ...)
+        :param id_val: entity id
+        :return: dict with url, body, etag, last_modified and fetched_at, or None
+        """
+        with self.transaction() as con:
+            row = con.execute(
+                'SELECT url, body, etag, last_modified, fetched_at FROM responses '
+                'WHERE entity = ? AND entity_id = ?', (entity, id_val)).fetchone()
+            if row is None:
+                return None
+            con.execute(
+                'UPDATE responses SET accessed_at = ? WHERE entity = ? AND entity_id = ?',
+                (time.time(), entity, id_val))
+        return dict(zip(('url', 'body', 'etag', 'last_modified', 'fetched_at'), row))
+
+    def put(self, entity, id_val, url, body, etag=None, last_modified=None):
+        """
+        store a response, evicting the least recently used ones if the cache is full
+        :return: None
+        """
+        now = time.time()
+        with self.transaction() as con:
+            con.execute(
+                'INSERT INTO responses '
+                '(entity, entity_id, url, body, etag, last_modified, fetched_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (entity, entity_id) DO UPDATE SET '
+                'url = excluded.url, body = excluded.body, etag = excluded.etag, '
+                'last_modified = excluded.last_modified, '
+                'fetched_at = excluded.fetched_at, accessed_at = excluded.accessed_at',
+                (entity, id_val, url, body, etag, last_modified, now, now))
+            self.evict('responses', self.max_entries)
+        return None
+
+    def touch(self, entity, id_val):
+        """
+        mark a response as fresh after the server confirmed it is unchanged
+        :return: None
+        """
+        now = time.time()
+        with self.transaction() as con:
+            con.execute(
+                'UPDATE responses SET fetched_at = ?, accessed_at = ? '
+                'WHERE entity = ? AND entity_id = ?', (now, now, entity, id_val))
+        return None
+
+    def clear(self, entity=None):
+        """
+        drop cached responses
+        :param entity: entity type to drop, None for all
+        :return: None
+        """
+        with self.transaction() as con:
+            if entity is None:
+                con.execute('DELETE FROM responses')
+            else:
+                con.execute('DELETE FROM responses WHERE entity = ?', (entity,))
+        return None
+
+
+class CachingFetcher(object):
+    def __init__(self, fetcher, cache, metadata_ttl=METADATA_TTL, marketplace_ttl=MARKETPLACE_TTL):
+        """
+        wrap a discogs_client fetcher so entity lookups are served from a ResponseCache
+        fresh entries make no request; stale entries are revalidated with
+        If-None-Match / If-Modified-Since and a 304 answer reuses the stored body
+        :param fetcher: the client's fetcher (client._fetcher)
+        :param cache: ResponseCache
+        :param metadata_ttl: seconds release, artist, label and master responses stay fresh
+        :param marketplace_ttl: seconds marketplace stats stay fresh; 0 always revalidates
+        """
+        self._fetcher = fetcher
+        self.cache = cache
+        self.ttls = {'metadata': metadata_ttl, 'marketplace': marketplace_ttl}
+        self.requests = 0  # requests sent to the server
+        self._local = threading.local()
+        self._record_headers(fetcher)
+
+    def _record_headers(self, fetcher):
+        # discogs_client fetchers return only the body and status code; keep the
+        # headers of the last response so ETag and Last-Modified can be stored
+        while hasattr(fetcher, 'fetcher') or hasattr(fetcher, '_fetcher'):
+            fetcher = getattr(fetcher, 'fetcher', None) or getattr(fetcher, '_fetcher')
+        request = getattr(fetcher, 'request', None)
+        if request is None:
+            return None
+        local = self._local
+
+        def recording_request(*args, **kwargs):
+            resp = request(*args, **kwargs)
+            local.headers = resp.headers
+            return resp
+
+        fetcher.request = recording_request
+        return None
+
+    def _send(self, client, method, url, data, headers, *args, **kwargs):
+        self._local.headers = {}
+        self.requests += 1
+        content, status_code = self._fetcher.fetch(
+            client, method, url, data, headers, *args, **kwargs)
+        return content, status_code, self._local.headers
+
+    def fetch(self, client, method, url, data=None, headers=None, *args, **kwargs):
+        key = parse_entity_url(url) if method == 'GET' else None
+        if key is None:
+            return self._send(client, method, url, data, headers, *args, **kwargs)[:2]
+        entity, id_val, kind = key
+        entry = self.cache.get(entity, id_val)
+        if entry is not None and entry['url'] != url:
+            entry = None
+        if entry is not None and time.time() - entry['fetched_at'] < self.ttls[kind]:
+            return entry['body'], 200
+        headers = dict(headers or {})
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        content, status_code, response_headers = self._send(
+            client, method, url, data, headers, *args, **kwargs)
+        if status_code == 304 and entry is not None:
+            self.cache.touch(entity, id_val)
+            return entry['body'], 200
+        if status_code == 200:
+            self.cache.put(
+                entity, id_val, url, content,
+                etag=response_headers.get('ETag'),
+                last_modified=response_headers.get('Last-Modified'))
+        return content, status_code
+
+    def __getattr__(self, name):
+        return getattr(self._fetcher, name)
+
+
+def install_response_cache(client, cache=None, **ttls):
+    """
+    serve the entity lookups of a discogs_client.Client from an on-disk cache
+    calling again on the same client only updates the ttls
+    :param client: discogs_client.Client
+    :param cache: ResponseCache, defaults to one at RESPONSE_CACHE_FILE
+    :param ttls: metadata_ttl and/or marketplace_ttl, seconds
+    :return: client
+    """
+    if isinstance(client._fetcher, CachingFetcher):
+        for name, seconds in ttls.items():
+            client._fetcher.ttls[name[:-len('_ttl')]] = seconds
+        if cache is not None:
+            client._fetcher.cache = cache
+        return client
+    if cache is None:
+        cache = ResponseCache()
+    client._fetcher = CachingFetcher(client._fetcher, cache, **ttls)
+    logging.info(f'discogs responses cached in {cache.path}')
+    return client
+
+
+def network_requests(client):
+    """
+    :param client: discogs_client.Client
+    :return: int, requests sent to the server through the response cache
+    """
+    return getattr(client._fetcher, 'requests', 0)
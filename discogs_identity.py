@@ -1,16 +1,41 @@
 from util import load_yaml
+from discogs_cache import (
+    install_response_cache, ResponseCache, DISCOGS_API_URL, RESPONSE_CACHE_FILE, api_scoped_path)
+from services import SERVICES
 import discogs_client
 
 
-app_keys = load_yaml("keys/discogs_howlucky.yaml")
-token_info = load_yaml("keys/discogs_dsnyder427_token.yaml")
+def make_client():
+    """
+    create the discogs client from the OAuth keys, with the response cache installed
+    :return: discogs_client.Client
+    """
+    if DISCOGS_API_URL:
+        client = discogs_client.Client(user_agent="HowLucky", user_token="mock")
+        client._base_url = DISCOGS_API_URL.rstrip("/")
+        install_response_cache(client, ResponseCache(api_scoped_path(RESPONSE_CACHE_FILE)))
+        return client
 
-dclient = discogs_client.Client(
-    user_agent="HowLucky",
-    consumer_key=app_keys["Consumer Key"],
-    consumer_secret=app_keys["Consumer Secret"],
-    token=token_info["token"],
-    secret=token_info["secret"],
-)
+    app_keys = load_yaml("keys/discogs_howlucky.yaml")
+    token_info = load_yaml("keys/discogs_dsnyder427_token.yaml")
 
-me = dclient.identity()
+    client = discogs_client.Client(
+        user_agent="HowLucky",
+        consumer_key=app_keys["Consumer Key"],
+        consumer_secret=app_keys["Consumer Secret"],
+        token=token_info["token"],
+        secret=token_info["secret"],
+    )
+    install_response_cache(client)
+    return client
+
+
+# created on first use, not at import
+dclient = SERVICES.lazy("dclient")
+
+
+def __getattr__(name):
+    # the authenticated user, fetched from the API on first use
+    if name == "me":
+        return SERVICES.get("identity")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
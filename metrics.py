@@ -0,0 +1,191 @@
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+
+# upper bounds of the latency histogram buckets, seconds
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.)
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+METRIC_HELP = {
+    'db_query_seconds': 'time to execute a statement, by database, statement and relation',
+    'db_fetch_seconds': 'time to fetch and convert result rows',
+    'db_rows_total': 'rows returned by queries or affected by writes',
+    'db_bytes_sent_total': 'bytes of SQL and COPY data sent to the database',
+    'db_bytes_received_total': 'estimated bytes of result rows received from the database',
+    'db_connection_wait_seconds': 'time spent waiting to check a connection out of the pool',
+    'callback_seconds': 'dash callback latency, by callback and outcome',
+    'function_seconds': 'latency of functions decorated with timeit',
+    'result_cache_requests_total': 'memoized dashboard results served from the cache or computed',
+    'log_lines_malformed_total': 'access log lines skipped because they did not parse',
+}
+
+
+class MetricsRegistry(object):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        thread-safe in-process store of counters and histograms
+        series are identified by a metric name and keyword labels
+        :param buckets: upper bounds of the histogram buckets
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        """
+        add to a counter
+        :return: None
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        return None
+
+    def observe(self, name, value, **labels):
+        """
+        record one observation in a histogram
+        :return: None
+        """
+        key = self._key(name, labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                # counts per bucket (the last is +Inf), then sum of values
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.]
+            hist[idx] += 1
+            hist[-1] += value
+        return None
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+        return None
+
+    def _quantile(self, counts, q):
+        """
+        estimate a quantile as the upper bound of the bucket holding it
+        None when it lies beyond the largest bucket
+        """
+        target = q * sum(counts)
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            if running >= target:
+                return bound
+        return None
+
+    def snapshot(self):
+        """
+        :return: dict, counters and histogram summaries (count, sum, mean, p50, p95, p99)
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(hist) for key, hist in self._histograms.items()}
+        output = {'counters': [], 'histograms': []}
+        for (name, labels), value in sorted(counters.items()):
+            output['counters'].append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), hist in sorted(histograms.items()):
+            counts, total = hist[:-1], hist[-1]
+            n = sum(counts)
+            output['histograms'].append({
+                'name': name, 'labels': dict(labels), 'count': n, 'sum': round(total, 6),
+                'mean': round(total / n, 6) if n else None,
+                'p50': self._quantile(counts, .5),
+                'p95': self._quantile(counts, .95),
+                'p99': self._quantile(counts, .99)})
+        return output
+
+    def render(self):
+        """
+        :return: str, every series in the prometheus text exposition format
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(hist) for key, hist in self._histograms.items()}
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in METRIC_HELP:
+                    lines.append(f'# HELP {name} {METRIC_HELP[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        def label_str(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in tuple(labels) + tuple(extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, 'counter')
+            lines.append(f'{name}{label_str(labels)} {value}')
+        for (name, labels), hist in sorted(histograms.items()):
+            describe(name, 'histogram')
+            running = 0
+            for bound, count in zip(self.buckets + ('+Inf',), hist[:-1]):
+                running += count
+                lines.append(f'{name}_bucket{label_str(labels, [("le", bound)])} {running}')
+            lines.append(f'{name}_sum{label_str(labels)} {hist[-1]}')
+            lines.append(f'{name}_count{label_str(labels)} {running}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+
+
+def instrument_callback(func):
+    """
+    decorator recording the latency of a dash callback in callback_seconds
+    put it beneath @callback so dash registers the wrapped function
+    outcome is ok, prevented (PreventUpdate) or error
+    """
+    from dash.exceptions import PreventUpdate  # the collectors use METRICS without dash
+    name = func.__name__
+
+    @wraps(func)
+    def func_(*args, **kwargs):
+        t1 = time.perf_counter()
+        outcome = 'ok'
+        try:
+            return func(*args, **kwargs)
+        except PreventUpdate:
+            outcome = 'prevented'
+            raise
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            METRICS.observe(
+                'callback_seconds', time.perf_counter() - t1, callback=name, outcome=outcome)
+    return func_
+
+
+def register_metrics_endpoint(server, path='/metrics'):
+    """
+    serve METRICS from a flask server, to local clients only
+    prometheus text by default, a json summary with ?format=json
+    :param server: flask.Flask
+    :param path: url of the endpoint
+    :return: None
+    """
+    from flask import Response, request, abort, jsonify
+
+    def metrics():
+        # requests relayed by a proxy carry X-Forwarded-For and are not local
+        if request.remote_addr not in LOCAL_ADDRESSES or 'X-Forwarded-For' in request.headers:
+            abort(403)
+        if request.args.get('format') == 'json':
+            return jsonify(METRICS.snapshot())
+        return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+    server.add_url_rule(path, 'metrics', metrics)
+    return None
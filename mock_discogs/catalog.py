@@ -0,0 +1,210 @@
+import math
+import random
+
+
+FORMATS = [('Vinyl', 'LP, Album'), ('Vinyl', '12", 33 ⅓ RPM'), ('Vinyl', '7", 45 RPM'),
+           ('CD', 'Album'), ('Cassette', 'Album')]
+COUNTRIES = ['US', 'UK', 'Germany', 'France', 'Japan', 'Netherlands', 'Canada', 'Italy']
+GENRES = {'Rock': ['Indie Rock', 'Psychedelic Rock', 'Prog Rock'],
+          'Electronic': ['House', 'Techno', 'Ambient'],
+          'Jazz': ['Hard Bop', 'Modal', 'Fusion'],
+          'Funk / Soul': ['Soul', 'Disco', 'Funk']}
+WORDS = ['blue', 'night', 'river', 'echo', 'golden', 'static', 'velvet', 'north', 'paper',
+         'signal', 'garden', 'machine', 'silver', 'harbor', 'motion', 'quiet', 'electric',
+         'summer', 'shadow', 'crystal', 'wild', 'orbit', 'lunar', 'distant', 'broken']
+
+
+class SyntheticCatalog(object):
+    def __init__(self, seed=0, n_releases=20000, n_artists=2000, n_labels=300,
+                 collection_size=500, wantlist_size=200, username='mockuser'):
+        """
+        deterministic synthetic discogs catalog
+        the same seed always produces the same releases, artists, labels, masters,
+        collection and wantlist; marketplace stats drift with time (hourly steps)
+        :param seed: random seed
+        :param n_releases: number of releases
+        :param n_artists: number of artists
+        :param n_labels: number of labels
+        :param collection_size: releases in the user's collection
+        :param wantlist_size: releases in the user's wantlist
+        :param username: name of the authenticated user
+        """
+        self.seed = seed
+        self.username = username
+        rng = random.Random(seed)
+        self.artists = {
+            1000 + i: {'name': self._name(rng, 2), 'profile': self._sentence(rng, 30)}
+            for i in range(n_artists)}
+        self.labels = {
+            5000 + i: {'name': f'{self._name(rng, 1)} Records', 'profile': self._sentence(rng, 15)}
+            for i in range(n_labels)}
+        artist_ids = list(self.artists)
+        label_ids = list(self.labels)
+        self.releases = {}
+        self.masters = {}
+        for i in range(n_releases):
+            release_id = 100000 + i
+            master_id = None
+            if rng.random() < .7:
+                master_id = 900000 + i // 3  # about three versions per master
+            genre = rng.choice(list(GENRES))
+            self.releases[release_id] = {
+                'title': self._name(rng, rng.randint(1, 4)),
+                'year': rng.choice([0] + list(range(1960, 2024))),
+                'country': rng.choice(COUNTRIES),
+                'format': rng.choice(FORMATS),
+                'artist_ids': rng.sample(artist_ids, 1 if rng.random() < .85 else 2),
+                'label_id': rng.choice(label_ids),
+                'catno': f'{rng.choice("ABCDEFGHJKLMNPRSTUVWXYZ")}{rng.randint(1, 99999):05d}',
+                'master_id': master_id,
+                'genre': genre,
+                'style': rng.choice(GENRES[genre]),
+                'n_tracks': rng.randint(2, 14),
+                'base_price': round(math.exp(rng.gauss(2.8, .8)), 2),
+                'supply': int(math.exp(rng.gauss(2., 1.3))),
+            }
+            if master_id is not None and master_id not in self.masters:
+                self.masters[master_id] = release_id
+        release_ids = list(self.releases)
+        picks = rng.sample(release_ids, min(len(release_ids), collection_size + wantlist_size))
+        self.collection = picks[:collection_size]
+        self.wantlist = picks[collection_size:]
+
+    @staticmethod
+    def _name(rng, n_words):
+        return ' '.join(rng.choice(WORDS).capitalize() for _ in range(n_words))
+
+    @staticmethod
+    def _sentence(rng, n_words):
+        return ' '.join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + '.'
+
+    # -------------------------------------------------------------------------
+    # - API payloads ----------------------------------------------------------
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _images(base_url, entity, id_val):
+        uri = f'{base_url}/images/{entity}/{id_val}.jpg'
+        return [{'type': 'primary', 'uri': uri, 'uri150': uri, 'resource_url': uri,
+                 'width': 600, 'height': 600}]
+
+    def _artist_stub(self, base_url, artist_id, join=''):
+        return {'id': artist_id, 'name': self.artists[artist_id]['name'], 'anv': '',
+                'join': join, 'role': '', 'tracks': '',
+                'resource_url': f'{base_url}/artists/{artist_id}'}
+
+    def _label_stub(self, base_url, release):
+        label_id = release['label_id']
+        return {'id': label_id, 'name': self.labels[label_id]['name'], 'catno': release['catno'],
+                'entity_type': '1', 'entity_type_name': 'Label',
+                'resource_url': f'{base_url}/labels/{label_id}'}
+
+    def _release_artists(self, base_url, release):
+        ids = release['artist_ids']
+        return [self._artist_stub(base_url, artist_id, '&' if n < len(ids) - 1 else '')
+                for n, artist_id in enumerate(ids)]
+
+    def _format(self, release):
+        name, text = release['format']
+        return [{'name': name, 'qty': '1', 'text': text, 'descriptions': text.split(', ')}]
+
+    def basic_information(self, base_url, release_id):
+        """
+        :return: dict, the basic_information of a collection or wantlist item
+        """
+        release = self.releases[release_id]
+        image = self._images(base_url, 'release', release_id)[0]['uri']
+        return {
+            'id': release_id, 'title': release['title'], 'year': release['year'],
+            'master_id': release['master_id'] or 0,
+            'formats': self._format(release),
+            'labels': [self._label_stub(base_url, release)],
+            'artists': self._release_artists(base_url, release),
+            'thumb': image, 'cover_image': image,
+            'genres': [release['genre']], 'styles': [release['style']],
+            'resource_url': f'{base_url}/releases/{release_id}'}
+
+    def release(self, base_url, release_id):
+        """
+        :return: dict, /releases/{id} response, or None if there is no such release
+        """
+        release = self.releases.get(release_id)
+        if release is None:
+            return None
+        output = self.basic_information(base_url, release_id)
+        output.update({
+            'country': release['country'],
+            'status': 'Accepted', 'data_quality': 'Needs Vote',
+            'uri': f'{base_url}/release/{release_id}',
+            'images': self._images(base_url, 'release', release_id),
+            'tracklist': [{'position': f'{"AB"[n % 2]}{n // 2 + 1}', 'type_': 'track',
+                           'title': f'Track {n + 1}', 'duration': ''}
+                          for n in range(release['n_tracks'])],
+            'extraartists': [], 'companies': [], 'videos': [],
+            'notes': '', 'artists_sort': release['title']})
+        if not release['master_id']:
+            del output['master_id']
+        else:
+            output['master_url'] = f"{base_url}/masters/{release['master_id']}"
+        return output
+
+    def artist(self, base_url, artist_id):
+        artist = self.artists.get(artist_id)
+        if artist is None:
+            return None
+        return {
+            'id': artist_id, 'name': artist['name'], 'realname': artist['name'],
+            'profile': artist['profile'], 'urls': [], 'namevariations': [],
+            'data_quality': 'Correct',
+            'images': self._images(base_url, 'artist', artist_id),
+            'uri': f'{base_url}/artist/{artist_id}',
+            'releases_url': f'{base_url}/artists/{artist_id}/releases',
+            'resource_url': f'{base_url}/artists/{artist_id}'}
+
+    def label(self, base_url, label_id):
+        label = self.labels.get(label_id)
+        if label is None:
+            return None
+        return {
+            'id': label_id, 'name': label['name'], 'profile': label['profile'],
+            'contact_info': '', 'urls': [], 'sublabels': [], 'data_quality': 'Correct',
+            'images': self._images(base_url, 'label', label_id),
+            'uri': f'{base_url}/label/{label_id}',
+            'releases_url': f'{base_url}/labels/{label_id}/releases',
+            'resource_url': f'{base_url}/labels/{label_id}'}
+
+    def master(self, base_url, master_id):
+        main_release = self.masters.get(master_id)
+        if main_release is None:
+            return None
+        release = self.release(base_url, main_release)
+        return {
+            'id': master_id, 'title': release['title'], 'year': release['year'],
+            'main_release': main_release,
+            'main_release_url': f'{base_url}/releases/{main_release}',
+            'artists': release['artists'], 'genres': release['genres'],
+            'styles': release['styles'], 'tracklist': release['tracklist'],
+            'images': self._images(base_url, 'master', master_id),
+            'data_quality': 'Correct', 'videos': [],
+            'versions_url': f'{base_url}/masters/{master_id}/versions',
+            'resource_url': f'{base_url}/masters/{master_id}'}
+
+    def marketplace_stats(self, release_id, when):
+        """
+        :param release_id: release id
+        :param when: unix time; prices take a step every hour
+        :return: dict, /marketplace/stats/{id} response, or None if there is no such release
+        """
+        release = self.releases.get(release_id)
+        if release is None:
+            return None
+        hour = int(when // 3600)
+        rng = random.Random(f'{self.seed}-{release_id}-{hour}')
+        num_for_sale = max(0, release['supply'] + rng.randint(-2, 2))
+        lowest_price = None
+        if num_for_sale:
+            drift = math.sin(hour / 24 + release_id % 17)  # slow daily swing
+            value = release['base_price'] * (1 + .1 * drift + rng.gauss(0, .03))
+            lowest_price = {'value': round(max(.5, value), 2), 'currency': 'USD'}
+        return {'num_for_sale': num_for_sale, 'lowest_price': lowest_price,
+                'blocked_from_sale': False}
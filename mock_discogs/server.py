@@ -0,0 +1,202 @@
+"""
+Local stand-in for the discogs API, serving a synthetic catalog
+
+    python -m mock_discogs.server --port 5050 --seed 0
+    DISCOGS_API_URL=http://127.0.0.1:5050 python collect_data.py
+"""
+
+import io
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import deque
+from flask import Flask, request, Response, abort
+from PIL import Image
+from mock_discogs.catalog import SyntheticCatalog
+from collector.rate_limit import DISCOGS_REQUESTS_PER_MINUTE
+
+
+class MovingWindowLimit(object):
+    def __init__(self, requests_per_minute=DISCOGS_REQUESTS_PER_MINUTE, window=60.):
+        """
+        the discogs rate limit: a number of requests per moving window, per client
+        :param requests_per_minute: requests allowed per window, 0 for no limit
+        :param window: seconds
+        """
+        self.limit = requests_per_minute
+        self.window = window
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def hit(self, client_key):
+        """
+        count a request
+        :param client_key: token or address identifying the client
+        :return: (allowed, used) where used is the number of requests in the window
+        """
+        now = time.monotonic()
+        with self._lock:
+            times = self._requests.setdefault(client_key, deque())
+            while times and now - times[0] > self.window:
+                times.popleft()
+            if self.limit and len(times) >= self.limit:
+                return False, len(times)
+            times.append(now)
+            return True, len(times)
+
+
+def paginate(items, key):
+    page = max(1, int(request.args.get('page', 1)))
+    per_page = min(100, max(1, int(request.args.get('per_page', 50))))
+    pages = max(1, -(-len(items) // per_page))
+    return {
+        'pagination': {'page': page, 'pages': pages, 'per_page': per_page, 'items': len(items),
+                       'urls': {}},
+        key: items[(page - 1) * per_page:page * per_page]
+    }
+
+
+def make_app(catalog, requests_per_minute=DISCOGS_REQUESTS_PER_MINUTE, latency=0.):
+    """
+    :param catalog: SyntheticCatalog
+    :param requests_per_minute: rate limit per client, 0 for none
+    :param latency: seconds added to every response
+    :return: flask.Flask
+    """
+    app = Flask(__name__)
+    limit = MovingWindowLimit(requests_per_minute)
+    username = catalog.username
+
+    def base_url():
+        return request.host_url.rstrip('/')
+
+    def respond(payload):
+        if payload is None:
+            abort(404)
+        body = json.dumps(payload)
+        etag = f'"{hashlib.md5(body.encode()).hexdigest()}"'
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304, headers={'ETag': etag})
+        return Response(body, mimetype='application/json', headers={'ETag': etag})
+
+    @app.before_request
+    def rate_limit():
+        if request.path.startswith('/images/'):
+            return None
+        if latency:
+            time.sleep(latency)
+        client_key = request.args.get('token') or request.remote_addr
+        allowed, used = limit.hit(client_key)
+        request.environ['ratelimit_used'] = used
+        if not allowed:
+            return Response(
+                json.dumps({'message': 'You are making requests too quickly.'}),
+                status=429, mimetype='application/json')
+        return None
+
+    @app.after_request
+    def rate_limit_headers(response):
+        if 'ratelimit_used' in request.environ and limit.limit:
+            used = request.environ['ratelimit_used']
+            response.headers['X-Discogs-Ratelimit'] = str(limit.limit)
+            response.headers['X-Discogs-Ratelimit-Used'] = str(used)
+            response.headers['X-Discogs-Ratelimit-Remaining'] = str(max(0, limit.limit - used))
+        return response
+
+    @app.errorhandler(404)
+    def not_found(_):
+        return Response(json.dumps({'message': 'Resource not found.'}),
+                        status=404, mimetype='application/json')
+
+    @app.route('/releases/<int:id_val>')
+    def release(id_val):
+        return respond(catalog.release(base_url(), id_val))
+
+    @app.route('/artists/<int:id_val>')
+    def artist(id_val):
+        return respond(catalog.artist(base_url(), id_val))
+
+    @app.route('/labels/<int:id_val>')
+    def label(id_val):
+        return respond(catalog.label(base_url(), id_val))
+
+    @app.route('/masters/<int:id_val>')
+    def master(id_val):
+        return respond(catalog.master(base_url(), id_val))
+
+    @app.route('/marketplace/stats/<int:id_val>')
+    def marketplace_stats(id_val):
+        return respond(catalog.marketplace_stats(id_val, time.time()))
+
+    @app.route('/oauth/identity')
+    def identity():
+        return respond({'id': 1, 'username': username, 'consumer_name': 'HowLucky',
+                        'resource_url': f'{base_url()}/users/{username}'})
+
+    @app.route(f'/users/{username}')
+    def user():
+        url = f'{base_url()}/users/{username}'
+        return respond({
+            'id': 1, 'username': username, 'resource_url': url,
+            'num_collection': len(catalog.collection), 'num_wantlist': len(catalog.wantlist),
+            'collection_folders_url': f'{url}/collection/folders',
+            'collection_fields_url': f'{url}/collection/fields',
+            'wantlist_url': f'{url}/wants', 'inventory_url': f'{url}/inventory'})
+
+    @app.route(f'/users/{username}/collection/folders')
+    def collection_folders():
+        url = f'{base_url()}/users/{username}/collection/folders'
+        return respond({'folders': [
+            {'id': 0, 'name': 'All', 'count': len(catalog.collection), 'resource_url': f'{url}/0'},
+            {'id': 1, 'name': 'Uncategorized', 'count': len(catalog.collection),
+             'resource_url': f'{url}/1'}]})
+
+    @app.route(f'/users/{username}/collection/folders/<int:folder_id>/releases')
+    def collection_releases(folder_id):
+        items = [{'id': release_id, 'instance_id': n + 1, 'folder_id': 1, 'rating': 0,
+                  'date_added': '2020-01-01T00:00:00-08:00',
+                  'basic_information': catalog.basic_information(base_url(), release_id)}
+                 for n, release_id in enumerate(catalog.collection)]
+        return respond(paginate(items, 'releases'))
+
+    @app.route(f'/users/{username}/wants')
+    def wants():
+        items = [{'id': release_id, 'rating': 0, 'notes': '',
+                  'basic_information': catalog.basic_information(base_url(), release_id)}
+                 for release_id in catalog.wantlist]
+        return respond(paginate(items, 'wants'))
+
+    @app.route('/images/<entity>/<int:id_val>.jpg')
+    def image(entity, id_val):
+        # a flat colour per entity so cached images can be told apart
+        colour = tuple(hashlib.md5(f'{entity}{id_val}'.encode()).digest()[:3])
+        stream = io.BytesIO()
+        Image.new('RGB', (150, 150), colour).save(stream, 'JPEG')
+        return Response(stream.getvalue(), mimetype='image/jpeg')
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--seed', help='catalog random seed', type=int, default=0)
+    parser.add_argument('--releases', help='number of releases', type=int, default=20000)
+    parser.add_argument('--artists', help='number of artists', type=int, default=2000)
+    parser.add_argument('--labels', help='number of labels', type=int, default=300)
+    parser.add_argument('--collection', help='releases in the collection', type=int, default=500)
+    parser.add_argument('--wantlist', help='releases in the wantlist', type=int, default=200)
+    parser.add_argument(
+        '--rpm', help='requests per minute per client, 0 for no limit',
+        type=int, default=DISCOGS_REQUESTS_PER_MINUTE)
+    parser.add_argument(
+        '--latency', help='milliseconds added to every API response', type=float, default=0)
+    args = parser.parse_args()
+    catalog = SyntheticCatalog(
+        seed=args.seed, n_releases=args.releases, n_artists=args.artists, n_labels=args.labels,
+        collection_size=args.collection, wantlist_size=args.wantlist)
+    app = make_app(catalog, requests_per_minute=args.rpm, latency=args.latency / 1000)
+    app.run(host=args.host, port=args.port, threaded=True)
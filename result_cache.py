@@ -0,0 +1,244 @@
+import json
+import time
+import pickle
+import hashlib
+import logging
+import threading
+from functools import wraps
+import pandas as pd
+from metrics import METRICS
+from sqlite_store import SqliteStore
+
+
+RESULT_CACHE_FILE = 'cache/results.sqlite'
+RESULT_TTL = 15 * 60  # seconds a memoized result is served
+RESULT_CACHE_MAX_ENTRIES = 5000
+SQLITE_TIMEOUT = 30  # seconds to wait for another process holding the write lock
+
+
+# entities results are tagged with, by their <entity>_id column or condition
+TAGGED_ENTITIES = ('release', 'artist', 'label', 'master')
+
+
+def entity_tags(entity, ids):
+    """
+    :param entity: release, artist, label or master
+    :param ids: iterable of ids, or None; missing ids (None, NaN) are skipped
+    :return: list of str, e.g. artist:123
+    """
+    return [f'{entity}:{int(id_val)}' for id_val in pd.unique(pd.Series(ids, dtype=object).dropna())]
+
+
+def release_tags(release_ids):
+    """
+    :param release_ids: iterable of release ids, or None
+    :return: list of str, the tags invalidated when prices for these releases arrive
+    """
+    return entity_tags('release', release_ids)
+
+
+def condition_tags(conditions):
+    """
+    :param conditions: dict of query conditions, e.g. {'artist_id': [1, 2]}
+    :return: list of str, tags of the entities the conditions filter on
+    """
+    tags = []
+    for entity in TAGGED_ENTITIES:
+        ids = conditions.get(f'{entity}_id')
+        if ids is not None:
+            tags += entity_tags(entity, ids if isinstance(ids, (list, tuple)) else [ids])
+    return tags
+
+
+def frame_tags(frames):
+    """
+    :param frames: iterable of data frames being written
+    :return: list of str, tags of every entity with an id in the frames
+    """
+    tags = set()
+    for df in frames:
+        for entity in TAGGED_ENTITIES:
+            if f'{entity}_id' in df.columns:
+                tags.update(entity_tags(entity, df[f'{entity}_id']))
+    return sorted(tags)
+
+
+class ResultCache(SqliteStore):
+    def __init__(self, path=RESULT_CACHE_FILE, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        """
+        on-disk store of memoized function results, shared by every process on the host
+        (all gunicorn workers and the collector). entries expire after their ttl,
+        the least recently used are evicted beyond max_entries, and entries can be
+        tagged (e.g. release:123) so a writer can invalidate everything built from
+        a release
+        :param path: sqlite file name
+        :param max_entries: number of results kept
+        """
+        super().__init__(path, schema=(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+            'expires_at REAL NOT NULL, accessed_at REAL NOT NULL, '
+            'PRIMARY KEY (namespace, key))',
+            'CREATE INDEX IF NOT EXISTS results_accessed_idx ON results (accessed_at)',
+            'CREATE TABLE IF NOT EXISTS result_tags ('
+            'tag TEXT NOT NULL, namespace TEXT NOT NULL, key TEXT NOT NULL, '
+            'PRIMARY KEY (tag, namespace, key))'
+        ), timeout=SQLITE_TIMEOUT, wal=True)
+        self.max_entries = max_entries
+
+    def get(self, namespace, key):
+        """
+        :param namespace: name of the memoized function
+        :param key: str, identifies the arguments
+        :return: (True, value) for a live entry, (False, None) otherwise
+        """
+        now = time.time()
+        with self.transaction() as con:
+            row = con.execute(
+                'SELECT value FROM results WHERE namespace = ? AND key = ? AND expires_at > ?',
+                (namespace, key, now)).fetchone()
+            if row is None:
+                return False, None
+            con.execute(
+                'UPDATE results SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                (now, namespace, key))
+        return True, pickle.loads(row[0])
+
+    def put(self, namespace, key, value, ttl=RESULT_TTL, tags=()):
+        """
+        store a result, evicting the least recently used entries beyond max_entries
+        :param namespace: name of the memoized function
+        :param key: str, identifies the arguments
+        :param value: any picklable object
+        :param ttl: seconds the result is served
+        :param tags: iterable of str, see invalidate
+        :return: None
+        """
+        now = time.time()
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.transaction() as con:
+            con.execute(
+                'INSERT INTO results (namespace, key, value, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE SET '
+                'value = excluded.value, expires_at = excluded.expires_at, '
+                'accessed_at = excluded.accessed_at',
+                (namespace, key, data, now + ttl, now))
+            con.executemany(
+                'INSERT OR IGNORE INTO result_tags (tag, namespace, key) VALUES (?, ?, ?)',
+                [(tag, namespace, key) for tag in tags])
+            if self.evict('results', self.max_entries):
+                self._delete_orphan_tags()
+        return None
+
+    def _delete_orphan_tags(self):
+        self._con.execute(
+            'DELETE FROM result_tags WHERE NOT EXISTS ('
+            'SELECT 1 FROM results r WHERE r.namespace = result_tags.namespace '
+            'AND r.key = result_tags.key)')
+
+    def invalidate(self, tags):
+        """
+        drop every result stored with any of the tags
+        :param tags: iterable of str
+        :return: int, number of results dropped
+        """
+        tags = list(tags)
+        if not tags:
+            return 0
+        placeholders = ', '.join('?' * len(tags))
+        with self.transaction() as con:
+            n = con.execute(
+                f'DELETE FROM results WHERE (namespace, key) IN ('
+                f'SELECT namespace, key FROM result_tags WHERE tag IN ({placeholders}))',
+                tags).rowcount
+            con.execute(f'DELETE FROM result_tags WHERE tag IN ({placeholders})', tags)
+        return n
+
+    def clear(self, namespace=None):
+        with self.transaction() as con:
+            if namespace is None:
+                con.execute('DELETE FROM results')
+                con.execute('DELETE FROM result_tags')
+            else:
+                con.execute('DELETE FROM results WHERE namespace = ?', (namespace,))
+                con.execute('DELETE FROM result_tags WHERE namespace = ?', (namespace,))
+        return None
+
+
+_RESULT_CACHE = None
+_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def get_result_cache():
+    """
+    the process-wide ResultCache, opened on first use (after gunicorn forks)
+    :return: ResultCache
+    """
+    global _RESULT_CACHE
+    with _RESULT_CACHE_LOCK:
+        if _RESULT_CACHE is None:
+            _RESULT_CACHE = ResultCache()
+    return _RESULT_CACHE
+
+
+def make_key(args, kwargs):
+    """
+    :return: str, a digest of the arguments of a call
+    """
+    text = json.dumps([args, kwargs], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def memoize(namespace, ttl=RESULT_TTL, tags=None, cache=None):
+    """
+    decorator serving the results of a function from the shared ResultCache
+    results are keyed by the function arguments, which must have a stable json form
+    (ids, lists of ids, dropdown values); a cache failure falls back to calling the function
+    :param namespace: name of the cached results, unique per function
+    :param ttl: seconds a result is served
+    :param tags: function called as tags(output, *args, **kwargs), returning the tags
+        to store the result with, e.g. release_tags of the releases it shows and
+        condition_tags of the entities it was filtered on
+    :param cache: ResultCache, defaults to get_result_cache()
+    """
+    def decorator(func):
+        @wraps(func)
+        def func_(*args, **kwargs):
+            key = make_key(args, kwargs)
+            try:
+                store = cache if cache is not None else get_result_cache()
+            except Exception as e:  # cache directory not writable, sqlite file locked or corrupt
+                logging.warning(f'result cache unavailable for {namespace}: {e}')
+                return func(*args, **kwargs)
+            try:
+                hit, value = store.get(namespace, key)
+            except Exception as e:  # sqlite errors, or an entry pickled from an older class
+                logging.warning(f'result cache read failed for {namespace}: {e}')
+                hit, value = False, None
+            METRICS.inc('result_cache_requests_total', namespace=namespace,
+                        result='hit' if hit else 'miss')
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            try:
+                store.put(namespace, key, value, ttl,
+                          tags(value, *args, **kwargs) if tags is not None else ())
+            except Exception as e:  # sqlite errors, or an unpicklable result (TypeError)
+                logging.warning(f'result cache write failed for {namespace}: {e}')
+            return value
+        return func_
+    return decorator
+
+
+def invalidate_frames(frames):
+    """
+    drop the memoized results built from the releases, artists, labels and masters
+    in rows just written (new prices, or a new release of an artist)
+    :param frames: iterable of data frames that were stored
+    :return: int, number of results dropped
+    """
+    try:
+        return get_result_cache().invalidate(frame_tags(frames))
+    except Exception as e:
+        logging.warning(f'result cache invalidation failed: {e}')
+        return 0
@@ -11,6 +11,8 @@ migration_control = dict(
     label_release=True
 )
 
+chunk_size = 50000  # rows held in memory at once
+
 db_from = get_db_object('mysql')
 db_to = get_db_object('postgres')
 
@@ -18,12 +20,12 @@ for table, migrate in migration_control.items():
 
     if migrate:
         print(f'migrating table {table}')
-        df = db_from.read_rows(table)
-        df = df.replace({np.nan: None})
-        if table == 'marketplace':
-            df = df.drop('qid', axis=1)
-        try:
-            df = df.drop('profile', axis=1)
-        except:
-            pass
-        db_to.insert_rows(df, table)
+        for df in db_from.read_rows(table, chunksize=chunk_size):
+            df = df.replace({np.nan: None})
+            if table == 'marketplace':
+                df = df.drop('qid', axis=1)
+            try:
+                df = df.drop('profile', axis=1)
+            except:
+                pass
+            db_to.insert_rows(df, table)
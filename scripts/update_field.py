@@ -4,15 +4,37 @@ Update a column in a table using the discogs API
 
 from database.database_util import get_metadata, store_release_metadata
 from discogs_search import get_entity, get_attribute
+from discogs_cache import network_requests
+from discogs_identity import dclient
 from util import sleep_random
 from pandas import DataFrame
 
 
-def update_field(tbl, index, field, db_):
-    for idx_, item_ in get_metadata(tbl).iterrows():
+def update_field(tbl, index, field, db_, chunk_size=100):
+    """
+    refresh one column of a table from the discogs API
+    entities in the response cache are read locally and skip the sleep
+    updated values are collected and written chunk_size rows at a time
+    :param tbl: table name
+    :param index: name of the id column (release_id, artist_id, ...)
+    :param field: name of the column to refresh
+    :param db_: DBPostgreSQL object
+    :param chunk_size: number of rows per update statement
+    :return: int, number of rows changed
+    """
+    pending = []
+    n_updated = 0
+    for idx_, item_ in get_metadata(db_, tbl, columns=[index]).iterrows():
         id_ = item_[index]
+        n_requests = network_requests(dclient)
         entity = get_entity(id_, index)
         attr_ = get_attribute(entity, field)
-        db_.update_rows(DataFrame([{index: id_, field: attr_}], index=[0]), index, tbl)
-        sleep_random()
-    return None
+        pending.append({index: id_, field: attr_})
+        if len(pending) >= chunk_size:
+            n_updated += db_.update_rows(DataFrame(pending), index, tbl)
+            pending = []
+        if network_requests(dclient) > n_requests:
+            sleep_random()
+    if pending:
+        n_updated += db_.update_rows(DataFrame(pending), index, tbl)
+    return n_updated
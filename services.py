@@ -0,0 +1,111 @@
+import threading
+from util import load_yaml
+from discogs_cache import DISCOGS_API_URL
+
+
+DB_KEYS_FILE = "keys/database_postgres.yaml"
+# against the mock discogs API (DISCOGS_API_URL set) synthetic prices go to a database of their own
+MOCK_DB_KEYS_FILE = "keys/database_postgres_mock.yaml"
+
+
+class ServiceContainer(object):
+    def __init__(self):
+        """
+        registry of shared objects that do i/o when created (database, discogs client)
+        each is created by its factory on first use, once per process, so importing
+        the app does no i/o and gunicorn can preload it and fork cheaply
+        usage:
+            DB = SERVICES.lazy('db')  # at import: nothing happens
+            DB.read_rows(...)  # first use: keys are read and the object is created
+        """
+        self._lock = threading.RLock()
+        self._factories = {}
+        self._instances = {}
+
+    def register(self, name, factory):
+        """
+        :param name: service name
+        :param factory: function of no arguments creating the service
+        :return: None
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+        return None
+
+    def get(self, name):
+        """
+        :return: the service, created on the first call
+        """
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def lazy(self, name):
+        """
+        :return: LazyService standing in for the service until it is used
+        """
+        return LazyService(self, name)
+
+    def initialized(self):
+        """
+        :return: list of str, the services created so far in this process
+        """
+        with self._lock:
+            return sorted(self._instances)
+
+    def reset(self, name=None):
+        """
+        forget a service (or all of them) so it is created again on next use
+        :return: None
+        """
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+        return None
+
+
+class LazyService(object):
+    """
+    stand-in for a service of a ServiceContainer, forwarding attribute reads and
+    writes to it; the service is created on the first access
+    """
+    def __init__(self, container, name):
+        object.__setattr__(self, '_container', container)
+        object.__setattr__(self, '_name', name)
+
+    def __getattr__(self, attr):
+        return getattr(self._container.get(self._name), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._container.get(self._name), attr, value)
+
+    def __repr__(self):
+        return f'<lazy {self._name}>'
+
+
+def db_keys_file():
+    """
+    :return: str, the database keys file for the discogs API in use
+    """
+    return MOCK_DB_KEYS_FILE if DISCOGS_API_URL else DB_KEYS_FILE
+
+
+def make_db():
+    from database.database_util_postgres import DBPostgreSQL
+    return DBPostgreSQL(SERVICES.get('db_keys'))
+
+
+def make_discogs_client():
+    from discogs_identity import make_client
+    return make_client()
+
+
+SERVICES = ServiceContainer()
+SERVICES.register('db_keys', lambda: load_yaml(db_keys_file()))
+SERVICES.register('db', make_db)
+SERVICES.register('dclient', make_discogs_client)
+SERVICES.register('identity', lambda: SERVICES.get('dclient').identity())
@@ -0,0 +1,64 @@
+-- Table: public.marketplace_daily
+
+-- DROP TABLE IF EXISTS public.marketplace_daily;
+
+CREATE TABLE IF NOT EXISTS public.marketplace_daily
+(
+    release_id bigint NOT NULL,
+    day date NOT NULL,
+    lowest_price numeric(20,2),
+    num_for_sale bigint,
+    n_samples bigint,
+    CONSTRAINT marketplace_daily_pkey PRIMARY KEY (release_id, day)
+)
+
+TABLESPACE pg_default;
+
+ALTER TABLE IF EXISTS public.marketplace_daily
+    OWNER to dsnyder;
+
+COMMENT ON TABLE public.marketplace_daily
+    IS 'marketplace prices bucketed by release and UTC day (min price, max number for sale)';
+
+
+-- Index: public.marketplace_release_when_idx
+
+-- DROP INDEX IF EXISTS public.marketplace_release_when_idx;
+
+CREATE INDEX IF NOT EXISTS marketplace_release_when_idx
+    ON public.marketplace USING btree
+    (release_id ASC NULLS LAST, "when" ASC NULLS LAST)
+    TABLESPACE pg_default;
+
+
+-- View: public.prices_daily
+
+-- DROP VIEW public.prices_daily;
+
+CREATE OR REPLACE VIEW public.prices_daily
+ AS
+ SELECT marketplace_daily.release_id,
+    releases.title,
+    releases.catno,
+    releases.year,
+    releases.country,
+    releases.master_id,
+    artists.name AS artist,
+    artists.artist_id,
+    labels.name AS label,
+    labels.label_id,
+    marketplace_daily.lowest_price,
+    marketplace_daily.num_for_sale,
+    marketplace_daily.n_samples,
+    (marketplace_daily.day::timestamp AT TIME ZONE 'UTC') AS "when"
+   FROM marketplace_daily
+     JOIN releases ON releases.release_id = marketplace_daily.release_id
+     JOIN artist_release ON artist_release.release_id = marketplace_daily.release_id
+     JOIN label_release ON label_release.release_id = marketplace_daily.release_id
+     JOIN artists ON artists.artist_id = artist_release.artist_id
+     JOIN labels ON label_release.label_id = labels.label_id
+  WHERE artist_release.artist_rank = 0 AND label_release.label_rank = 0
+  ORDER BY artists.name, releases.release_id, marketplace_daily.day;
+
+ALTER TABLE public.prices_daily
+    OWNER TO dsnyder;
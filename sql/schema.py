@@ -1,4 +1,4 @@
-from util import load_yaml
+from services import SERVICES
 
 
 DB_CHOICE = "postgres"
@@ -6,6 +6,8 @@ SCHEMA_NAME = "public"  # postgresql
 
 # historial price data table
 MARKETPLACE_TABLE = "marketplace"
+# marketplace prices bucketed by release and day
+MARKETPLACE_DAILY_TABLE = "marketplace_daily"
 SEARCH_TABLE = "search"
 # node tables
 RELEASE_TABLE = "releases"
@@ -33,7 +35,14 @@ ALL_ENT = [
 
 # views
 PRICES_VIEW = "prices"
+PRICES_DAILY_VIEW = "prices_daily"
 
 
-DB_KEYS_POSTGRES = load_yaml("keys/database_postgres.yaml")
 # DB_KEYS_MYSQL = load_yaml('keys/database_mysql_root.yaml')
+
+
+def __getattr__(name):
+    # DB_KEYS_POSTGRES is read from services.db_keys_file() on first use, not at import
+    if name == "DB_KEYS_POSTGRES":
+        return SERVICES.get("db_keys")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
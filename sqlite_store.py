@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+SQLITE_TIMEOUT = 5  # seconds to wait for another process holding the write lock
+
+
+class SqliteStore(object):
+    def __init__(self, path, schema=(), timeout=SQLITE_TIMEOUT, wal=False):
+        """
+        base of the small local sqlite stores (result cache, response cache,
+        checkpoints, traffic sketches): one connection per object, shared by the
+        threads of a process under a lock
+        :param path: sqlite file name, its directory is created if missing
+        :param schema: iterable of CREATE ... IF NOT EXISTS statements
+        :param timeout: seconds to wait for another process holding the write lock
+        :param wal: write-ahead logging, so readers in other processes do not block on a writer
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        with self._con:
+            if wal:
+                self._con.execute('PRAGMA journal_mode=WAL')
+            for statement in schema:
+                self._con.execute(statement)
+
+    @contextmanager
+    def transaction(self):
+        """
+        hold the lock and commit on exit, or roll back on an exception
+        usage:
+            with self.transaction() as con:
+                con.execute(...)
+        """
+        with self._lock, self._con:
+            yield self._con
+
+    def fetchone(self, sql, params=()):
+        with self._lock:
+            return self._con.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self._lock:
+            return self._con.execute(sql, params).fetchall()
+
+    def evict(self, table, max_entries, order_by='accessed_at'):
+        """
+        delete the first rows of a table by order_by once it holds more than max_entries
+        call within transaction()
+        :param table: table name
+        :param max_entries: number of rows kept
+        :param order_by: column, the rows evicted first sort lowest (least recently used)
+        :return: int, number of rows deleted
+        """
+        n = self._con.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+        if n <= max_entries:
+            return 0
+        # evict down to 90% so eviction does not run on every insert
+        return self._con.execute(
+            f'DELETE FROM {table} WHERE rowid IN ('
+            f'SELECT rowid FROM {table} ORDER BY {order_by} LIMIT ?)',
+            (n - int(.9 * max_entries),)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+        return None
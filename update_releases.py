@@ -2,13 +2,20 @@
 update the releases table
 """
 
+import time
+import logging
 import argparse
-from database.database_util import get_metadata, store_release_metadata
+from discogs_client.exceptions import HTTPError
+from database.database_util import (
+    get_metadata, update_daily_prices, ReleaseBatch, prepare_metadata_frames)
 from database.database_util_postgres import DBPostgreSQL
 from discogs_search import get_entity, get_attribute
 from scripts.update_field import update_field
 from sql.schema import DB_KEYS_POSTGRES
 from util import sleep_random
+from collector.checkpoint import CheckpointStore
+from discogs_cache import network_requests
+from discogs_identity import dclient
 
 
 parser = argparse.ArgumentParser()
@@ -37,34 +44,120 @@ parser.add_argument(
     action="store_true",
     default=False,
 )
+parser.add_argument(
+    "--backfill_daily",
+    help="rebuild the daily price rollup (marketplace_daily) from all marketplace history",
+    action="store_true",
+    default=False,
+)
+parser.add_argument(
+    "--restart",
+    help="ignore the saved position of --find_missing and start from the first id",
+    action="store_true",
+    default=False,
+)
+parser.add_argument(
+    "--fresh_hours",
+    help="--find_missing skips releases it tried within this many hours",
+    type=float,
+    default=24,
+)
+parser.add_argument(
+    "--batch_size",
+    help="number of releases --find_missing writes per transaction",
+    type=int,
+    default=25,
+)
 parser.add_argument(
     '--debug',
-    help='turn on debug output',
+    help='turn on debug output, including the API requests each release costs',
     action='store_true',
     default=False
 )
 args = parser.parse_args()
+logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+READ_CHUNK_SIZE = 10000
+LOOKUP_RETRIES = 3  # retries of a release after a rate limit, server or network error
+RETRY_BACKOFF = 30  # seconds before the first retry, doubled for each one after
+
+
+def is_transient(error):
+    # rate limits, server errors and lost connections pass; other client errors do not
+    if isinstance(error, HTTPError):
+        return error.status_code == 429 or error.status_code >= 500
+    return True
+
+
+def lookup_release(release_id):
+    """
+    fetch a release and prepare its rows, retrying transient errors with a growing wait
+    :param release_id: discogs release id
+    :return: dict, table name -> data frame
+    raises the last error when it is not transient or the retries are used up
+    """
+    for attempt in range(LOOKUP_RETRIES + 1):
+        try:
+            return prepare_metadata_frames(get_entity(release_id, "release_id"))
+        except Exception as e:
+            if attempt == LOOKUP_RETRIES or not is_transient(e):
+                raise
+            wait = RETRY_BACKOFF * 2 ** attempt
+            logging.warning(f"release {release_id}: {e}, retrying in {wait} seconds")
+            time.sleep(wait)
+
 
 db = DBPostgreSQL(DB_KEYS_POSTGRES)
 
 if args.format_details:
     update_field("releases", "release_id", "format_details", db_=db)
 elif args.find_missing:
-    r = db.read_rows("releases")
-    m = db.read_rows("unique_releases")
-    missing_releases = set(m["release_id"]) - set(r["release_id"])
-    for release_id in sorted(list(missing_releases)):
-        if args.debug:
-            print(release_id)
-        try:
-            release = get_entity(release_id, "release_id")
-            store_release_metadata(db, release)
-            sleep_random()
-        except:
-            pass
+    missing_releases = set()
+    for chunk in db.read_rows(
+            "unique_releases", chunksize=READ_CHUNK_SIZE, columns=["release_id"]):
+        missing_releases.update(chunk["release_id"])
+    for chunk in db.read_rows(
+            "releases", chunksize=READ_CHUNK_SIZE, columns=["release_id"]):
+        missing_releases.difference_update(chunk["release_id"])
+    checkpoint = CheckpointStore()
+    job = "find_missing"
+    if args.restart:
+        checkpoint.set_cursor(job, None)
+    cursor = int(checkpoint.get_cursor(job, default=-1))
+    fresh = checkpoint.fresh_ids(job, args.fresh_hours * 3600)
+
+    def mark_stored(release_ids):
+        checkpoint.mark_fetched(job, release_ids)
+        checkpoint.set_cursor(job, max(release_ids))
+
+    with ReleaseBatch(db, batch_size=args.batch_size, on_flush=mark_stored) as batch:
+        for release_id in sorted(list(missing_releases)):
+            if release_id <= cursor or release_id in fresh:
+                continue
+            if args.debug:
+                print(release_id)
+            n_requests = network_requests(dclient)
+            # only the API lookups are guarded: a failed write (flush) stops the run
+            try:
+                frames = lookup_release(release_id)
+            except HTTPError as e:
+                logging.warning(f"release {release_id}: discogs returned {e.status_code}")
+                if e.status_code == 404:
+                    # gone for good: skip it for --fresh_hours like a stored release
+                    checkpoint.mark_fetched(job, [release_id])
+            except Exception as e:
+                # left unmarked, so the next run tries it again
+                logging.warning(f"release {release_id}: {e}")
+            else:
+                batch.add(frames, key=release_id)
+            if network_requests(dclient) > n_requests:
+                sleep_random()
+    checkpoint.set_cursor(job, None)  # finished; the next run scans from the start
 elif args.artist_url:
     update_field("artists", "artist_id", "image", db_=db)
 elif args.release_url:
     update_field("releases", "release_id", "image", db_=db)
+elif args.backfill_daily:
+    update_daily_prices(db)
 else:
     pass